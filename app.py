@@ -2,175 +2,202 @@
 Main Flask application - routes and error handlers only
 """
 
-from flask import render_template, request, jsonify, session, send_file, abort
-from datetime import datetime
+from flask import render_template, request, jsonify, session, send_file, send_from_directory, abort, Response
+from jinja2 import TemplateNotFound
 import os
-import re
-import json
+import time
+import hashlib
+import orjson
 
 # Import our modular components
-from config import create_app, setup_logging, setup_rate_limiter, setup_claude_client, ensure_directories
-from file_processors import process_uploaded_file, validate_file, load_server_files
+from config import create_app, setup_logging, setup_rate_limiter, setup_cache, claude_configured, get_claude_client, ensure_directories
+from config import API_RATE_LIMIT, DATA_WRITE_RATE_LIMIT
+from file_processors import process_and_validate_uploads, load_server_files
 from page_handlers import handle_no_call_page, handle_claude_call_page
-from utils import get_session_id, get_server_files_info
+from utils import get_session_id, get_server_files_info, get_page_configuration, page_template_name, template_exists, clean_field_name, utc_timestamp
+from utils import data_filename, sanitize_directory_name, warm_page_configurations
+from utils import directory_exists, ensure_directory, load_data_file
 from binary_file_handler import serve_binary_file, list_binary_files
 
 # Initialize application components
 app = create_app()
 logger = setup_logging()
 limiter = setup_rate_limiter(app)
-claude_client = setup_claude_client()
+cache = setup_cache(app)
 
 # Ensure required directories exist
 ensure_directories()
 
+# Parse page template configurations up front so first requests are warm
+logger.info("Warmed page configuration for %s templates", warm_page_configurations(app.template_folder))
+
 # Log initialization status
-if claude_client:
+if claude_configured():
     logger.info("Application initialized successfully with Claude API")
 else:
     logger.warning("Application initialized without Claude API")
 
+def handle_claude_call(page_name, form_data, uploaded_files_data, server_files_data, session_id):
+    """Handle Claude API pages with the application's Claude client"""
+    return handle_claude_call_page(page_name, form_data, uploaded_files_data, server_files_data, session_id, get_claude_client())
+
+# Last /health response body and the second it was built for
+_health_cache = {'ts': 0, 'body': b''}
+
+# Browsers may cache the favicon response for a year
+FAVICON_MAX_AGE = 31536000
+
+# Seconds a rendered 404/500 page is reused
+ERROR_PAGE_CACHE_TIMEOUT = 300
+
+# Error pages used when the 404/500 templates can't be rendered
+FALLBACK_404_HTML = b'''<html><body>
+<h1>404 Page Not Found</h1>
+<p>The page you're looking for doesn't exist.</p>
+<a href="/">Go Home</a>
+</body></html>
+'''
+
+FALLBACK_500_HTML = b'''<html><body>
+<h1>500 Internal Server Error</h1>
+<p>The server encountered an internal error.</p>
+<a href="/">Go Home</a>
+</body></html>
+'''
+
+# Page type -> handler used by generic_api
+PAGE_TYPE_HANDLERS = {
+    'no-call': handle_no_call_page,  # No Claude API, just return organized data
+    'claude-call': handle_claude_call,
+}
+
+def html_response(body):
+    """HTML response with a content-hash ETag, answered with 304 when the client's copy matches"""
+    response = Response(body, mimetype='text/html')
+    response.set_etag(hashlib.blake2b(response.get_data(), digest_size=16).hexdigest())
+    return response.make_conditional(request)
+
+@cache.cached(timeout=30, key_prefix='home_page')
+def render_home():
+    """Render the home page (cached, it doesn't depend on the request)"""
+    return render_template('home.html')
+
 # Routes
 @app.route('/')
 def home():
     session_id = get_session_id()
-    logger.info(f"Home page accessed - Session: {session_id}")
-    return render_template('home.html')
+    logger.info("Home page accessed - Session: %s", session_id)
+    return html_response(render_home())
 
 @app.route('/health')
 def health():
-    return jsonify({
-        'status': 'healthy',
-        'timestamp': datetime.utcnow().isoformat(),
-        'claude_available': claude_client is not None
-    })
+    # Health probes hit this constantly, so the body is rebuilt at most once a second
+    now = int(time.time())
+    if now != _health_cache['ts']:
+        _health_cache['body'] = orjson.dumps({
+            'status': 'healthy',
+            'timestamp': utc_timestamp(),
+            'claude_available': claude_configured()
+        })
+        _health_cache['ts'] = now
+    # The body only changes once a second, so let proxies and probes reuse it that long
+    return Response(_health_cache['body'], mimetype='application/json',
+                    headers={'Cache-Control': 'public, max-age=1'})
 
 @app.route('/favicon.ico')
 def favicon():
-    return '', 204  # No content response
+    """Serve static/favicon.ico if present; either way let browsers cache the answer"""
+    if os.path.isfile(os.path.join(app.static_folder, 'favicon.ico')):
+        return send_from_directory(app.static_folder, 'favicon.ico', max_age=FAVICON_MAX_AGE)
+    return '', 204, {'Cache-Control': f'public, max-age={FAVICON_MAX_AGE}'}  # No content response
 
-@app.route('/<page_name>')
+@app.route('/<page:page_name>')
 def generic_page(page_name):
     """Serve any page that has a corresponding template"""
-    session_id = get_session_id()
-    logger.info(f"Page accessed: {page_name} - Session: {session_id}")
+    # Reject unknown pages before touching the session, templates or server files
+    if not template_exists(app.jinja_env, page_template_name(page_name)):
+        abort(404)
     
-    # Convert URL format to template format (e.g., chairs-promotion-letter -> chairs_promotion_letter.html)
-    template_name = page_name.replace('-', '_') + '.html'
+    session_id = get_session_id()
+    logger.info("Page accessed: %s - Session: %s", page_name, session_id)
     
-    # Check if template specifies additional server directories
-    directories_to_load = [page_name]  # Always include the page's own directory
-    try:
-        template_path = os.path.join(app.template_folder, template_name)
-        if os.path.exists(template_path):
-            with open(template_path, 'r') as f:
-                content = f.read()
-                # Look for server_dirs_config in the template
-                config_match = re.search(r'<script[^>]*id="server_dirs_config"[^>]*>(.*?)</script>', content, re.DOTALL)
-                if config_match:
-                    try:
-                        config_json = config_match.group(1).strip()
-                        config = json.loads(config_json)
-                        if isinstance(config, dict) and 'directories' in config:
-                            # Add specified directories (but keep page directory first)
-                            for dir_name in config['directories']:
-                                if dir_name not in directories_to_load:
-                                    directories_to_load.append(dir_name)
-                            logger.info(f"Page {page_name} loading from directories: {directories_to_load}")
-                    except json.JSONDecodeError:
-                        logger.warning(f"Invalid JSON in server_dirs_config for {page_name}")
-    except Exception as e:
-        logger.warning(f"Error checking template for server_dirs_config: {e}")
+    # Resolve template and server directories (cached per page)
+    page_config = get_page_configuration(page_name, app.template_folder)
+    template_name = page_config['template_name']
+    directories_to_load = page_config['directories']
     
     # Load server files for this page to show on the page
     try:
         server_files_info = get_server_files_info(page_name, directories_to_load)
-        logger.info(f"Server files info loaded for {page_name}: {len(server_files_info)} files")
+        logger.info("Server files info loaded for %s: %s files", page_name, len(server_files_info))
     except Exception as e:
-        logger.error(f"Error loading server files info for {page_name}: {e}")
+        logger.error("Error loading server files info for %s: %s", page_name, e)
         server_files_info = []
     
     try:
-        return render_template(template_name, page_name=page_name, server_files_info=server_files_info)
-    except Exception as e:
-        logger.error(f"Template error for {template_name}: {e}")
-        return render_template('404.html'), 404
+        return html_response(render_template(template_name, page_name=page_name, server_files_info=server_files_info))
+    except TemplateNotFound as e:
+        # Template removed since the index was built, or it includes a missing template
+        logger.warning("Template not found for %s: %s", template_name, e)
+        abort(404)
 
-@app.route('/api/<page_name>', methods=['POST'])
-@limiter.limit("5 per minute")
+@app.route('/api/<page:page_name>', methods=['POST'])
+@limiter.limit(API_RATE_LIMIT)
 def generic_api(page_name):
     """Generic API endpoint that handles any page"""
     try:
+        # Check page type first so unknown types are rejected before any file work
+        page_type = request.form.get('page_type', 'claude-call')
+        page_handler = PAGE_TYPE_HANDLERS.get(page_type)
+        if page_handler is None:
+            return jsonify({'error': f'Unknown page type: {page_type}'}), 400
+        
         # Handle file uploads - process all uploaded files
         uploaded_files_data = {}
         
-        for field_name in request.files:
-            file = request.files[field_name]
-            if file and file.filename:
-                is_valid, message = validate_file(file)
-                if not is_valid:
-                    return jsonify({'error': f'{field_name} error: {message}'}), 400
-                
-                try:
-                    file_data = process_uploaded_file(file)
-                    if file_data:
-                        # Clean up field name for context
-                        clean_field_name = field_name.replace('_file', '').replace('_', ' ')
-                        uploaded_files_data[clean_field_name] = file_data
-                        logger.info(f"File processed: {file.filename} for field {field_name}")
-                except Exception as e:
-                    return jsonify({'error': f'Error processing {field_name}: {str(e)}'}), 400
+        uploads = [(field_name, file) for field_name, file in request.files.items()
+                   if file and file.filename]
         
-        # Check if this page specifies additional server directories
-        directories_to_load = [page_name]  # Always include the page's own directory
-        template_name = page_name.replace('-', '_') + '.html'
         try:
-            template_path = os.path.join(app.template_folder, template_name)
-            if os.path.exists(template_path):
-                with open(template_path, 'r') as f:
-                    content = f.read()
-                    config_match = re.search(r'<script[^>]*id="server_dirs_config"[^>]*>(.*?)</script>', content, re.DOTALL)
-                    if config_match:
-                        try:
-                            config_json = config_match.group(1).strip()
-                            config = json.loads(config_json)
-                            if isinstance(config, dict) and 'directories' in config:
-                                for dir_name in config['directories']:
-                                    if dir_name not in directories_to_load:
-                                        directories_to_load.append(dir_name)
-                                logger.info(f"API for {page_name} loading from directories: {directories_to_load}")
-                        except json.JSONDecodeError:
-                            logger.warning(f"Invalid JSON in server_dirs_config for {page_name}")
-        except Exception as e:
-            logger.warning(f"Error checking template for server_dirs_config: {e}")
+            processed_uploads = process_and_validate_uploads(uploads)
+        finally:
+            # Only the extracted content is used from here on, so release the spooled
+            # uploads (temp files / buffers) now rather than after the Claude call
+            for _, file in uploads:
+                file.close()
+        
+        for field_name, file, is_valid, message, file_data in processed_uploads:
+            if not is_valid:
+                return jsonify({'error': f'{field_name} error: {message}'}), 400
+            
+            if isinstance(file_data, Exception):
+                return jsonify({'error': f'Error processing {field_name}: {str(file_data)}'}), 400
+            
+            if file_data:
+                # Clean up field name for context
+                uploaded_files_data[clean_field_name(field_name)] = file_data
+                logger.info("File processed: %s for field %s", file.filename, field_name)
+        
+        # Check if this page specifies additional server directories
+        directories_to_load = get_page_configuration(page_name, app.template_folder)['directories']
         
         # Load server files for this page
         server_files_data = load_server_files(page_name, directories_to_load)
         
-        # Handle form data
+        # Handlers get a plain dict they are free to modify
         form_data = request.form.to_dict()
         session_id = get_session_id()
         
-        logger.info(f"API called for page: {page_name} - Session: {session_id}")
+        logger.info("API called for page: %s - Session: %s", page_name, session_id)
         
-        # Check page type based on form data
-        page_type = form_data.get('page_type', 'claude-call')
-        
-        if page_type == 'no-call':
-            # Handle no-call pages (no Claude API, just return organized data)
-            return handle_no_call_page(page_name, form_data, uploaded_files_data, server_files_data, session_id)
-        elif page_type == 'claude-call':
-            # Handle Claude API pages (existing functionality)
-            return handle_claude_call_page(page_name, form_data, uploaded_files_data, server_files_data, session_id, claude_client)
-        else:
-            return jsonify({'error': f'Unknown page type: {page_type}'}), 400
+        return page_handler(page_name, form_data, uploaded_files_data, server_files_data, session_id)
     
     except Exception as e:
-        logger.error(f"Error in API for page {page_name}: {e}")
+        logger.error("Error in API for page %s: %s", page_name, e)
         return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/<page_name>/save-data', methods=['POST'])
-@limiter.limit("10 per minute")
+@app.route('/api/<page:page_name>/save-data', methods=['POST'])
+@limiter.limit(DATA_WRITE_RATE_LIMIT)
 def save_page_data(page_name):
     """Generic endpoint to save JSON data for a page"""
     try:
@@ -178,28 +205,23 @@ def save_page_data(page_name):
         if not data or 'filename' not in data or 'content' not in data:
             return jsonify({'error': 'Missing filename or content'}), 400
         
-        filename = data['filename']
-        # Ensure filename ends with .json
-        if not filename.endswith('.json'):
-            filename += '.json'
-        
-        # Security: sanitize filename to prevent directory traversal
-        filename = re.sub(r'[^a-zA-Z0-9_\-\.]', '', filename)
+        # Security: sanitize filename (ending in .json) to prevent directory traversal
+        filename = data_filename(data['filename'])
         
         # Optionally allow saving to a different directory if specified
         target_dir = data.get('directory', page_name)
         # Sanitize directory name
-        target_dir = re.sub(r'[^a-zA-Z0-9_\-]', '', target_dir)
+        target_dir = sanitize_directory_name(target_dir)
         
         # Save to server_files directory
         save_path = f"/app/server_files/{target_dir}/{filename}"
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        ensure_directory(os.path.dirname(save_path))
         
-        # Save content as JSON
-        with open(save_path, 'w', encoding='utf-8') as f:
-            json.dump(data['content'], f, indent=2, ensure_ascii=False)
+        # Save content as JSON (UTF-8, indented like the previous json.dump output)
+        with open(save_path, 'wb') as f:
+            f.write(orjson.dumps(data['content'], option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
         
-        logger.info(f"Saved data to {save_path}")
+        logger.info("Saved data to %s", save_path)
         return jsonify({
             'success': True, 
             'message': 'Data saved successfully',
@@ -208,40 +230,38 @@ def save_page_data(page_name):
         })
         
     except Exception as e:
-        logger.error(f"Error saving data for {page_name}: {e}")
+        logger.error("Error saving data for %s: %s", page_name, e)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/<page_name>/load-data/<filename>', methods=['GET'])
+@app.route('/api/<page:page_name>/load-data/<filename>', methods=['GET'])
 def load_page_data(page_name, filename):
     """Generic endpoint to load JSON data for a page"""
     try:
-        # Ensure filename ends with .json
-        if not filename.endswith('.json'):
-            filename += '.json'
-        
-        # Sanitize filename
-        filename = re.sub(r'[^a-zA-Z0-9_\-\.]', '', filename)
+        # Sanitize filename (ending in .json)
+        filename = data_filename(filename)
         
         # Check if a different directory is requested
         source_dir = request.args.get('directory', page_name)
         # Sanitize directory name
-        source_dir = re.sub(r'[^a-zA-Z0-9_\-]', '', source_dir)
+        source_dir = sanitize_directory_name(source_dir)
         
         load_path = f"/app/server_files/{source_dir}/{filename}"
         
-        if not os.path.exists(load_path):
+        try:
+            file_stat = os.stat(load_path)
+        except FileNotFoundError:
             # Try without .json if it was double-added
             alt_path = load_path.replace('.json.json', '.json')
-            if os.path.exists(alt_path):
+            try:
+                file_stat = os.stat(alt_path)
                 load_path = alt_path
-            else:
-                logger.warning(f"File not found: {load_path}")
+            except FileNotFoundError:
+                logger.warning("File not found: %s", load_path)
                 return jsonify({'error': 'File not found', 'path': f"{source_dir}/{filename}"}), 404
         
-        with open(load_path, 'r', encoding='utf-8') as f:
-            content = json.load(f)
+        content = load_data_file(load_path, file_stat.st_mtime_ns, file_stat.st_size)
         
-        logger.info(f"Loaded data from {load_path}")
+        logger.info("Loaded data from %s", load_path)
         return jsonify({
             'success': True, 
             'content': content,
@@ -249,42 +269,42 @@ def load_page_data(page_name, filename):
             'directory': source_dir
         })
         
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON decode error loading {page_name}/{filename}: {e}")
+    except orjson.JSONDecodeError as e:
+        logger.error("JSON decode error loading %s/%s: %s", page_name, filename, e)
         return jsonify({'error': 'Invalid JSON file'}), 400
     except Exception as e:
-        logger.error(f"Error loading data for {page_name}/{filename}: {e}")
+        logger.error("Error loading data for %s/%s: %s", page_name, filename, e)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/<page_name>/list-data', methods=['GET'])
+@app.route('/api/<page:page_name>/list-data', methods=['GET'])
 def list_page_data(page_name):
     """List available JSON data files for a page"""
     try:
         # Check if a different directory is requested
         source_dir = request.args.get('directory', page_name)
         # Sanitize directory name
-        source_dir = re.sub(r'[^a-zA-Z0-9_\-]', '', source_dir)
+        source_dir = sanitize_directory_name(source_dir)
         
         data_dir = f"/app/server_files/{source_dir}"
         
-        if not os.path.exists(data_dir):
+        if not directory_exists(data_dir):
             return jsonify({'success': True, 'files': []})
         
-        # List all JSON files
-        json_files = []
-        for filename in os.listdir(data_dir):
-            if filename.endswith('.json'):
-                file_path = os.path.join(data_dir, filename)
-                if os.path.isfile(file_path):
-                    file_stat = os.stat(file_path)
-                    json_files.append({
-                        'filename': filename,
-                        'size': file_stat.st_size,
-                        'modified': datetime.fromtimestamp(file_stat.st_mtime).isoformat()
-                    })
-        
-        # Sort by modified date, newest first
-        json_files.sort(key=lambda x: x['modified'], reverse=True)
+        # List all JSON files (scandir entries carry the file type, so one stat per file)
+        entries = []
+        with os.scandir(data_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.json') and entry.is_file():
+                    file_stat = entry.stat()
+                    entries.append((file_stat.st_mtime, entry.name, file_stat.st_size))
+        
+        # Sort by modified date, newest first, then format
+        entries.sort(key=lambda item: item[0], reverse=True)
+        json_files = [{
+            'filename': filename,
+            'size': size,
+            'modified': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(mtime))
+        } for mtime, filename, size in entries]
         
         return jsonify({
             'success': True,
@@ -293,25 +313,21 @@ def list_page_data(page_name):
         })
         
     except Exception as e:
-        logger.error(f"Error listing data files for {page_name}: {e}")
+        logger.error("Error listing data files for %s: %s", page_name, e)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/<page_name>/delete-data/<filename>', methods=['DELETE'])
-@limiter.limit("10 per minute")
+@app.route('/api/<page:page_name>/delete-data/<filename>', methods=['DELETE'])
+@limiter.limit(DATA_WRITE_RATE_LIMIT)
 def delete_page_data(page_name, filename):
     """Delete a JSON data file for a page"""
     try:
-        # Ensure filename ends with .json
-        if not filename.endswith('.json'):
-            filename += '.json'
-        
-        # Sanitize filename
-        filename = re.sub(r'[^a-zA-Z0-9_\-\.]', '', filename)
+        # Sanitize filename (ending in .json)
+        filename = data_filename(filename)
         
         # Check if a different directory is requested
         target_dir = request.args.get('directory', page_name)
         # Sanitize directory name
-        target_dir = re.sub(r'[^a-zA-Z0-9_\-]', '', target_dir)
+        target_dir = sanitize_directory_name(target_dir)
         
         delete_path = f"/app/server_files/{target_dir}/{filename}"
         
@@ -319,7 +335,7 @@ def delete_page_data(page_name, filename):
             return jsonify({'error': 'File not found'}), 404
         
         os.remove(delete_path)
-        logger.info(f"Deleted file: {delete_path}")
+        logger.info("Deleted file: %s", delete_path)
         
         return jsonify({
             'success': True,
@@ -329,16 +345,17 @@ def delete_page_data(page_name, filename):
         })
         
     except Exception as e:
-        logger.error(f"Error deleting file {page_name}/{filename}: {e}")
+        logger.error("Error deleting file %s/%s: %s", page_name, filename, e)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/<page_name>/file/<filename>', methods=['GET'])
+@app.route('/api/<page:page_name>/file/<filename>', methods=['GET'])
 def serve_page_file(page_name, filename):
     """Serve binary files from server_files directory"""
-    logger.info(f"Binary file request: {page_name}/{filename}")
+    logger.info("Binary file request: %s/%s", page_name, filename)
     return serve_binary_file(page_name, filename)
 
-@app.route('/api/<page_name>/files', methods=['GET'])
+@app.route('/api/<page:page_name>/files', methods=['GET'])
+@cache.cached(timeout=30, query_string=True)
 def list_page_files(page_name):
     """List available binary files for a page"""
     extensions = request.args.getlist('ext')  # e.g., ?ext=.docx&ext=.pdf
@@ -354,34 +371,28 @@ def too_large(e):
 def ratelimit_handler(e):
     return jsonify({'error': 'Rate limit exceeded. Please try again later.'}), 429
 
+def error_page(template_name, fallback_html):
+    """Rendered error page body; error templates are static, so renders are cached for a few minutes"""
+    cache_key = f'error_page/{template_name}'
+    body = cache.get(cache_key)
+    if body is None:
+        body = fallback_html  # Used if the template is missing or fails
+        if template_exists(app.jinja_env, template_name):
+            try:
+                body = render_template(template_name).encode('utf-8')
+            except Exception as render_error:
+                logger.error("Error rendering %s: %s", template_name, render_error)
+        cache.set(cache_key, body, timeout=ERROR_PAGE_CACHE_TIMEOUT)
+    return body
+
 @app.errorhandler(404)
 def not_found(e):
-    try:
-        return render_template('404.html'), 404
-    except:
-        # Fallback if 404.html template fails
-        return '''
-        <html><body>
-        <h1>404 Page Not Found</h1>
-        <p>The page you're looking for doesn't exist.</p>
-        <a href="/">Go Home</a>
-        </body></html>
-        ''', 404
+    return error_page('404.html', FALLBACK_404_HTML), 404, {'Content-Type': 'text/html; charset=utf-8'}
 
 @app.errorhandler(500)
 def internal_error(e):
-    logger.error(f"Internal server error: {e}")
-    try:
-        return render_template('500.html'), 500
-    except:
-        # Fallback if 500.html template fails
-        return '''
-        <html><body>
-        <h1>500 Internal Server Error</h1>
-        <p>The server encountered an internal error.</p>
-        <a href="/">Go Home</a>
-        </body></html>
-        ''', 500
+    logger.error("Internal server error: %s", e)
+    return error_page('500.html', FALLBACK_500_HTML), 500, {'Content-Type': 'text/html; charset=utf-8'}
 
 if __name__ == '__main__':
     # Run the application
@@ -3,6 +3,7 @@ Asana API client wrapper for read-only operations
 """
 
 import os
+import time
 import logging
 import asana
 from typing import Dict, List, Optional, Any
@@ -28,6 +29,10 @@ class AsanaClient:
         self.tags_api = None
         self.custom_fields_api = None
         
+        # Workspace details rarely change: (info, fetched_at) reused for workspace_info_ttl seconds
+        self.workspace_info_ttl = 300.0
+        self._workspace_info = None
+        
         if self.access_token:
             try:
                 # Initialize with modern API format
@@ -69,21 +74,28 @@ class AsanaClient:
         return self.api_client is not None
     
     def get_workspace_info(self) -> Optional[Dict]:
-        """Get current workspace information"""
+        """Get current workspace information (cached for workspace_info_ttl seconds)"""
         if not self.is_connected():
             return None
         
+        now = time.monotonic()
+        if self._workspace_info is not None and now - self._workspace_info[1] < self.workspace_info_ttl:
+            return dict(self._workspace_info[0])
+        
         try:
             workspace = self.workspaces_api.get_workspace(self.workspace_gid, {})
             # Handle both dict and object responses
             if isinstance(workspace, dict):
-                return workspace
+                info = workspace
             else:
-                return {
+                info = {
                     'gid': workspace.gid if hasattr(workspace, 'gid') else workspace.get('gid'),
                     'name': workspace.name if hasattr(workspace, 'name') else workspace.get('name'),
                     'is_organization': workspace.is_organization if hasattr(workspace, 'is_organization') else workspace.get('is_organization', False)
                 }
+            # Only successful lookups are cached, so errors are retried on the next call
+            self._workspace_info = (info, now)
+            return dict(info)
         except Exception as e:
             logger.error(f"Error fetching workspace info: {e}")
             return None
@@ -5,10 +5,35 @@ Binary file handler for serving files from server_files directory
 import os
 import logging
 from flask import send_file, abort
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import safe_join
+from utils import directory_exists
 
 logger = logging.getLogger(__name__)
 
+SERVER_FILES_ROOT = "/app/server_files"
+_SERVER_FILES_REALPATH = os.path.realpath(SERVER_FILES_ROOT)
+
+# Browsers and proxies may reuse a served file for this long, then revalidate with its ETag
+BINARY_FILE_MAX_AGE = int(os.environ.get('BINARY_FILE_MAX_AGE', '86400'))
+
+# MIME types for the file extensions we serve
+MIME_TYPES = {
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.doc': 'application/msword',
+    '.pdf': 'application/pdf',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.xls': 'application/vnd.ms-excel',
+    '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    '.ppt': 'application/vnd.ms-powerpoint',
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.txt': 'text/plain',
+    '.csv': 'text/csv'
+}
+
 def serve_binary_file(page_name, filename):
     """
     Serve a binary file from the server_files directory
@@ -26,56 +51,41 @@ def serve_binary_file(page_name, filename):
         filename = unquote(filename)
         
         # Construct safe path to file
-        base_path = "/app/server_files"
-        file_path = safe_join(base_path, page_name, filename)
+        file_path = safe_join(SERVER_FILES_ROOT, page_name, filename)
         
-        # Security check - ensure path is within server_files
-        if not file_path or not file_path.startswith(base_path):
-            logger.warning(f"Invalid file path attempted: {page_name}/{filename}")
+        # Security check - ensure the resolved path (after symlinks) is within server_files
+        if not file_path or not os.path.realpath(file_path).startswith(_SERVER_FILES_REALPATH + os.sep):
+            logger.warning("Invalid file path attempted: %s/%s", page_name, filename)
             abort(403)
         
-        # Check if file exists
-        if not os.path.exists(file_path):
-            logger.warning(f"File not found: {file_path}")
-            abort(404)
-        
-        # Check if it's a file (not directory)
+        # Check it exists and is a file (not directory) with a single stat
         if not os.path.isfile(file_path):
-            logger.warning(f"Path is not a file: {file_path}")
+            logger.warning("File not found: %s", file_path)
             abort(404)
         
         # Determine MIME type based on extension
-        mime_types = {
-            '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            '.doc': 'application/msword',
-            '.pdf': 'application/pdf',
-            '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            '.xls': 'application/vnd.ms-excel',
-            '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-            '.ppt': 'application/vnd.ms-powerpoint',
-            '.png': 'image/png',
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.gif': 'image/gif',
-            '.txt': 'text/plain',
-            '.csv': 'text/csv'
-        }
-        
         file_ext = os.path.splitext(filename)[1].lower()
-        mime_type = mime_types.get(file_ext, 'application/octet-stream')
+        mime_type = MIME_TYPES.get(file_ext, 'application/octet-stream')
         
-        logger.info(f"Serving binary file: {file_path} as {mime_type}")
+        logger.debug("Serving binary file: %s as %s", file_path, mime_type)
         
-        # Send file with appropriate headers
+        # Pass the path (not a file object) so the WSGI server can sendfile() it;
+        # ETag/Last-Modified let repeat requests get a 304 and Range requests work
         return send_file(
             file_path,
             mimetype=mime_type,
             as_attachment=False,  # Display in browser if possible
-            download_name=filename
+            download_name=filename,
+            conditional=True,
+            etag=True,
+            max_age=BINARY_FILE_MAX_AGE
         )
         
+    except HTTPException:
+        # Let the 403/404 aborts above through instead of turning them into a 500
+        raise
     except Exception as e:
-        logger.error(f"Error serving binary file {page_name}/{filename}: {e}")
+        logger.error("Error serving binary file %s/%s: %s", page_name, filename, e)
         abort(500)
 
 def list_binary_files(page_name, extensions=None):
@@ -92,7 +102,7 @@ def list_binary_files(page_name, extensions=None):
     files_list = []
     server_dir = f"/app/server_files/{page_name}"
     
-    if not os.path.exists(server_dir):
+    if not directory_exists(server_dir):
         return files_list
     
     try:
@@ -120,5 +130,5 @@ def list_binary_files(page_name, extensions=None):
         return files_list
         
     except Exception as e:
-        logger.error(f"Error listing binary files for {page_name}: {e}")
+        logger.error("Error listing binary files for %s: %s", page_name, e)
         return []
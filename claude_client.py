@@ -1,29 +1,209 @@
 """
 Claude API client wrapper for AI text generation and analysis
+
+Summaries and question generation run on CLAUDE_FAST_MODEL (a Haiku model,
+several times cheaper and faster than Sonnet) unless CLAUDE_MODEL_MAP
+overrides the per-task choice; everything else uses CLAUDE_MODEL.
 """
 
 import os
+import re
+import json
+import time
+import asyncio
+import hashlib
 import logging
+import threading
+from collections import OrderedDict, deque
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 import anthropic
-from typing import Dict, List, Optional, Any
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
 from datetime import datetime
+from types import MappingProxyType
 
 logger = logging.getLogger(__name__)
 
+# Responses to calls at or below this temperature are treated as repeatable and cached
+CACHEABLE_TEMPERATURE = 0.3
+RESPONSE_CACHE_SIZE = 1024
+TOKEN_COUNT_CACHE_SIZE = 1024
+
+# Instructions for each analyze() type
+ANALYSIS_PROMPTS = MappingProxyType({
+    "summary": "Please provide a concise summary of the following text, highlighting key points:",
+    "sentiment": "Analyze the sentiment and tone of the following text. Provide scores for: positive, negative, neutral, and identify emotional themes:",
+    "themes": "Identify and list the main themes, topics, and concepts in the following text:",
+    "key_points": "Extract the key points and important information from the following text as a bulleted list:",
+    "entities": "Identify and categorize all named entities (people, organizations, locations, dates, etc.) in the following text:",
+    "questions": "Generate relevant research questions based on the following text:",
+    "critique": "Provide a critical analysis of the arguments, evidence, and logic in the following text:"
+})
+
+# Instructions for each compare_texts() type
+COMPARISON_PROMPTS = MappingProxyType({
+    "differences": "Compare these two texts and highlight the key differences:",
+    "similarities": "Compare these two texts and identify the similarities and common themes:",
+    "both": "Provide a detailed comparison of these two texts, noting both similarities and differences:",
+    "factual": "Compare the factual claims in these two texts and identify any contradictions or agreements:"
+})
+
+# Instructions for each generate_questions() type (formatted with num_questions)
+QUESTION_PROMPTS = MappingProxyType({
+    "research": "Generate {num_questions} research questions that could be explored based on this text:",
+    "comprehension": "Generate {num_questions} comprehension questions to test understanding of this text:",
+    "critical": "Generate {num_questions} critical thinking questions that challenge the assumptions in this text:",
+    "followup": "Generate {num_questions} follow-up questions for further investigation based on this text:"
+})
+
+# Leading "1." / "2)" numbering on generated question lines
+QUESTION_NUMBER_RE = re.compile(r'^\d+[\.\)]\s*')
+_JSON_DECODER = json.JSONDecoder()
+
+# Connection pool shared by all requests from one client; HTTP/2 multiplexes
+# concurrent requests over a few kept-alive connections
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+HTTP_TIMEOUT = httpx.Timeout(float(os.environ.get('CLAUDE_TIMEOUT', '120')), connect=5.0)
+
+# A successful connection test is trusted for this long by new clients with the same key and model
+CONNECTION_TEST_TTL = 300.0
+
+# Oversized contexts are split into chunks of at most this share of the context window
+CONTEXT_CHUNK_FRACTION = 0.25
+CONTEXT_CONDENSE_ROUNDS = 3
+CONDENSE_PROMPT = ("Extract everything in the context that is relevant to the request below, "
+                   "as concise notes. Do not answer the request itself.\n\nRequest:\n{prompt}")
+
+# compare_texts() compares summaries instead of full texts when both together are longer than this
+COMPARE_SUMMARY_CHARS = int(os.environ.get('CLAUDE_COMPARE_SUMMARY_CHARS', '40000'))
+
+SystemPrompt = Union[str, List[Dict[str, Any]]]
+
+
+def cached_system_prompt(text: str) -> List[Dict[str, Any]]:
+    """System prompt block marked for Anthropic prompt caching
+    
+    Repeat requests that start with the same block within the cache lifetime
+    (about 5 minutes) are billed at the cache-read rate for it. Prefixes shorter
+    than the model's minimum cacheable length are simply not cached.
+    """
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+
+def find_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """Return the first JSON object embedded in text, or None
+    
+    Each '{' is tried as the start of an object and decoded in a single
+    forward pass; unlike a greedy regex this ignores braces in surrounding
+    prose and never spans two separate objects.
+    """
+    start = text.find('{')
+    while start != -1:
+        try:
+            value, _ = _JSON_DECODER.raw_decode(text, start)
+            if isinstance(value, dict):
+                return value
+        except json.JSONDecodeError:
+            pass
+        start = text.find('{', start + 1)
+    return None
+
+
+@lru_cache(maxsize=128)
+def extraction_instructions(schema_json: str) -> str:
+    """Extraction system prompt for a serialized schema, built once per schema
+    
+    Reusing the identical string keeps the prompt a byte-stable cacheable prefix
+    across documents extracted with the same schema.
+    """
+    return f"""Extract information from the text according to this schema:
+{schema_json}
+
+Return the extracted data as valid JSON matching the schema structure.
+Only include information explicitly stated in the text."""
+
+
+class TokenBudgetTracker:
+    """Rolling one-minute budget of tokens and requests shared by a client's calls
+    
+    Each call reserves its estimated tokens (prompt plus max_tokens) before it
+    goes out and settles the reservation to the real usage afterwards. A
+    limit of 0 disables that check.
+    """
+    
+    def __init__(self, tokens_per_minute: int = 0, requests_per_minute: int = 0,
+                 window: float = 60.0):
+        self.tokens_per_minute = tokens_per_minute
+        self.requests_per_minute = requests_per_minute
+        self.window = window
+        self._entries = deque()  # [reserved_at, tokens] per request
+        self._lock = threading.Lock()
+    
+    def reserve(self, tokens: int):
+        """Reserve tokens for a request
+        
+        Returns:
+            tuple: (entry, 0.0) if reserved, or (None, seconds to wait before retrying)
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._entries and now - self._entries[0][0] >= self.window:
+                self._entries.popleft()
+            
+            over_requests = self.requests_per_minute and len(self._entries) >= self.requests_per_minute
+            over_tokens = (self.tokens_per_minute and self._entries and
+                           sum(entry[1] for entry in self._entries) + tokens > self.tokens_per_minute)
+            if over_requests or over_tokens:
+                return None, self._entries[0][0] + self.window - now
+            
+            entry = [now, tokens]
+            self._entries.append(entry)
+            return entry, 0.0
+    
+    def settle(self, entry, tokens: int):
+        """Replace a reservation's estimate with the tokens the request actually used"""
+        with self._lock:
+            entry[1] = tokens
+
 
 class ClaudeClient:
     """Wrapper class for Claude API operations"""
     
+    # (api_key, model) -> monotonic time of the last successful connection test
+    _verified_at = {}
+    
     def __init__(self):
         """Initialize Claude client with environment credentials"""
         self.client = None
         self.api_key = os.environ.get('CLAUDE_API_KEY')
         self.model = os.environ.get('CLAUDE_MODEL', 'claude-3-sonnet-20240229')
+        # Per-task model overrides: analysis type, 'questions', 'compare' or 'extract' -> model
+        self.model_map = self._load_model_map()
         self.max_tokens = int(os.environ.get('CLAUDE_MAX_TOKENS', '4000'))
+        self.context_window = int(os.environ.get('CLAUDE_CONTEXT_WINDOW', '200000'))
+        # The SDK retries 429/529/5xx responses with jittered exponential backoff
+        self.max_retries = int(os.environ.get('CLAUDE_MAX_RETRIES', '4'))
+        # Account limits to stay under (0 = don't track)
+        self.budget = TokenBudgetTracker(int(os.environ.get('CLAUDE_TPM', '0')),
+                                         int(os.environ.get('CLAUDE_RPM', '0')))
+        # Maximum in-flight requests for the async methods (abatch_process etc.)
+        self.concurrency = int(os.environ.get('CLAUDE_CONCURRENCY', '8'))
+        self._http_client = None
+        self._async_client = None
+        self._async_loop = None
+        # Exact-match cache of low-temperature responses: request key -> text
+        self._response_cache = OrderedDict()
+        self._response_cache_lock = threading.Lock()
+        # Token counts from the count_tokens endpoint: text key -> input tokens
+        self._token_count_cache = OrderedDict()
+        self._token_count_cache_lock = threading.Lock()
         
         if self.api_key and self.api_key != 'your_claude_api_key_here':
             try:
-                self.client = anthropic.Anthropic(api_key=self.api_key)
+                self._http_client = anthropic.DefaultHttpxClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+                self.client = anthropic.Anthropic(api_key=self.api_key, max_retries=self.max_retries,
+                                                  http_client=self._http_client)
                 logger.info(f"Claude client initialized with model: {self.model}")
                 
                 # Test the connection with a minimal call
@@ -35,7 +215,11 @@ class ClaudeClient:
             logger.warning("No Claude API key provided or using placeholder")
     
     def _test_connection(self):
-        """Test the API connection with a minimal request"""
+        """Test the API connection with a minimal request, at most once per CONNECTION_TEST_TTL"""
+        key = (self.api_key, self.model)
+        if time.monotonic() - ClaudeClient._verified_at.get(key, float('-inf')) < CONNECTION_TEST_TTL:
+            return
+        
         try:
             # Very short test to verify API key works
             message = self.client.messages.create(
@@ -43,29 +227,54 @@ class ClaudeClient:
                 max_tokens=10,
                 messages=[{"role": "user", "content": "Hi"}]
             )
+            ClaudeClient._verified_at[key] = time.monotonic()
             logger.info("Claude API connection verified")
         except Exception as e:
             logger.error(f"Claude API connection test failed: {e}")
             self.client = None
             raise
     
+    def close(self):
+        """Close the client's pooled HTTP connections"""
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
+        self.client = None
+    
+    async def aclose(self):
+        """Close the async client's pooled HTTP connections (and the sync ones)"""
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+            self._async_loop = None
+        self.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
     def is_connected(self) -> bool:
         """Check if client is connected to Claude API"""
         return self.client is not None
     
     def generate(self, prompt: str, context: Optional[str] = None, 
-                 system_prompt: Optional[str] = None,
+                 system_prompt: Optional[SystemPrompt] = None,
                  temperature: float = 0.7,
-                 max_tokens: Optional[int] = None) -> str:
+                 max_tokens: Optional[int] = None,
+                 model: Optional[str] = None) -> str:
         """
         Generate text using Claude
         
         Args:
             prompt: The user's prompt/question
             context: Optional context (documents, data, etc.)
-            system_prompt: Optional system instructions
+            system_prompt: Optional system instructions (a string, or a list of
+                text blocks such as cached_system_prompt() returns)
             temperature: Creativity parameter (0-1)
             max_tokens: Override default max tokens
+            model: Override the default model
             
         Returns:
             Generated text response
@@ -74,40 +283,350 @@ class ClaudeClient:
             raise Exception("Claude client not connected")
         
         try:
-            # Build the user message
-            user_message = prompt
-            if context:
-                user_message = f"Context:\n{context}\n\nRequest:\n{prompt}"
-            
-            # Build messages array
-            messages = [{"role": "user", "content": user_message}]
+            params = self._build_fitted_request(prompt, context, system_prompt, temperature, max_tokens, model)
             
-            # Build request parameters
-            params = {
-                "model": self.model,
-                "max_tokens": max_tokens or self.max_tokens,
-                "messages": messages,
-                "temperature": temperature
-            }
+            cache_key = self._response_cache_key(params)
+            cached = self._cached_response(cache_key)
+            if cached is not None:
+                return cached
             
-            # Add system prompt if provided
-            if system_prompt:
-                params["system"] = system_prompt
+            entry = self._reserve_budget(params)
+            logger.info(f"Calling Claude API with {self._prompt_chars(params)} character prompt")
+            try:
+                message = self.client.messages.create(**params)
+            except Exception:
+                # Nothing was spent, so don't let the estimate hold the budget shut
+                self.budget.settle(entry, 0)
+                raise
+            self._settle_budget(entry, message)
+            return self._store_response(cache_key, self._response_text(message))
             
-            # Make API call
-            logger.info(f"Calling Claude API with {len(user_message)} character prompt")
-            message = self.client.messages.create(**params)
+        except Exception as e:
+            logger.error(f"Error generating text with Claude: {e}")
+            raise
+    
+    async def agenerate(self, prompt: str, context: Optional[str] = None,
+                        system_prompt: Optional[SystemPrompt] = None,
+                        temperature: float = 0.7,
+                        max_tokens: Optional[int] = None,
+                        model: Optional[str] = None) -> str:
+        """Async version of generate(), so callers can await many requests at once"""
+        if not self.is_connected():
+            raise Exception("Claude client not connected")
+        
+        try:
+            params = await self._abuild_fitted_request(prompt, context, system_prompt, temperature, max_tokens, model)
             
-            # Extract response text
-            response_text = message.content[0].text
-            logger.info(f"Claude generated {len(response_text)} characters")
+            cache_key = self._response_cache_key(params)
+            cached = self._cached_response(cache_key)
+            if cached is not None:
+                return cached
             
-            return response_text
+            entry = await self._areserve_budget(params)
+            logger.info(f"Calling Claude API with {self._prompt_chars(params)} character prompt")
+            try:
+                message = await self._get_async_client().messages.create(**params)
+            except Exception:
+                self.budget.settle(entry, 0)
+                raise
+            self._settle_budget(entry, message)
+            return self._store_response(cache_key, self._response_text(message))
             
         except Exception as e:
             logger.error(f"Error generating text with Claude: {e}")
             raise
     
+    def generate_stream(self, prompt: str, context: Optional[str] = None,
+                        system_prompt: Optional[SystemPrompt] = None,
+                        temperature: float = 0.7,
+                        max_tokens: Optional[int] = None,
+                        model: Optional[str] = None) -> Iterator[str]:
+        """
+        Generate text using Claude, yielding it in chunks as it is produced
+        
+        Takes the same arguments as generate(). The full text is cached like
+        generate()'s once the stream completes.
+        """
+        if not self.is_connected():
+            raise Exception("Claude client not connected")
+        
+        try:
+            params = self._build_fitted_request(prompt, context, system_prompt, temperature, max_tokens, model)
+            cache_key = self._response_cache_key(params)
+            cached = self._cached_response(cache_key)
+            if cached is not None:
+                yield cached
+                return
+            
+            entry = self._reserve_budget(params)
+            logger.info(f"Streaming Claude API response for {self._prompt_chars(params)} character prompt")
+            try:
+                with self.client.messages.stream(**params) as stream:
+                    for text in stream.text_stream:
+                        yield text
+                    message = stream.get_final_message()
+            except Exception:
+                self.budget.settle(entry, 0)
+                raise
+            self._settle_budget(entry, message)
+            self._store_response(cache_key, self._response_text(message))
+            
+        except Exception as e:
+            logger.error(f"Error streaming text from Claude: {e}")
+            raise
+    
+    async def agenerate_stream(self, prompt: str, context: Optional[str] = None,
+                               system_prompt: Optional[SystemPrompt] = None,
+                               temperature: float = 0.7,
+                               max_tokens: Optional[int] = None,
+                               model: Optional[str] = None) -> AsyncIterator[str]:
+        """Async version of generate_stream()"""
+        if not self.is_connected():
+            raise Exception("Claude client not connected")
+        
+        try:
+            params = await self._abuild_fitted_request(prompt, context, system_prompt, temperature, max_tokens, model)
+            cache_key = self._response_cache_key(params)
+            cached = self._cached_response(cache_key)
+            if cached is not None:
+                yield cached
+                return
+            
+            entry = await self._areserve_budget(params)
+            logger.info(f"Streaming Claude API response for {self._prompt_chars(params)} character prompt")
+            try:
+                async with self._get_async_client().messages.stream(**params) as stream:
+                    async for text in stream.text_stream:
+                        yield text
+                    message = await stream.get_final_message()
+            except Exception:
+                self.budget.settle(entry, 0)
+                raise
+            self._settle_budget(entry, message)
+            self._store_response(cache_key, self._response_text(message))
+            
+        except Exception as e:
+            logger.error(f"Error streaming text from Claude: {e}")
+            raise
+    
+    def _get_async_client(self) -> anthropic.AsyncAnthropic:
+        """AsyncAnthropic client for the running event loop
+        
+        Its connection pool belongs to the loop that first used it, so a new
+        client is made when called from a different loop (e.g. successive
+        asyncio.run() calls).
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = anthropic.AsyncAnthropic(
+                api_key=self.api_key, max_retries=self.max_retries,
+                http_client=anthropic.DefaultAsyncHttpxClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+            )
+            self._async_loop = loop
+        return self._async_client
+    
+    def _build_request(self, prompt: str, context: Optional[str],
+                       system_prompt: Optional[SystemPrompt], temperature: float,
+                       max_tokens: Optional[int], model: Optional[str] = None) -> Dict[str, Any]:
+        """Build the messages.create() parameters shared by generate() and agenerate()"""
+        # Build the user message; context goes in its own cached block so a
+        # large document reused with different prompts is only prefilled once
+        if context:
+            user_message = [
+                {"type": "text", "text": f"Context:\n{context}", "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": f"Request:\n{prompt}"}
+            ]
+        else:
+            user_message = prompt
+        
+        # Build messages array
+        messages = [{"role": "user", "content": user_message}]
+        
+        # Build request parameters
+        params = {
+            "model": model or self.model,
+            "max_tokens": max_tokens or self.max_tokens,
+            "messages": messages,
+            "temperature": temperature
+        }
+        
+        # Add system prompt if provided
+        if system_prompt:
+            params["system"] = system_prompt
+        
+        return params
+    
+    def _build_fitted_request(self, prompt: str, context: Optional[str],
+                              system_prompt: Optional[SystemPrompt], temperature: float,
+                              max_tokens: Optional[int], model: Optional[str] = None) -> Dict[str, Any]:
+        """Build a request's parameters, condensing an oversized context until it fits
+        
+        Shared by generate(), agenerate() and their streaming versions; raises
+        ValueError if the request still doesn't fit after CONTEXT_CONDENSE_ROUNDS.
+        """
+        params = self._build_request(prompt, context, system_prompt, temperature, max_tokens, model)
+        for _ in range(CONTEXT_CONDENSE_ROUNDS):
+            if self._fits_context_window(params):
+                return params
+            context = self._condense_context(prompt, context)
+            params = self._build_request(prompt, context, system_prompt, temperature, max_tokens, model)
+        self._require_fit(params)
+        return params
+    
+    async def _abuild_fitted_request(self, prompt: str, context: Optional[str],
+                                     system_prompt: Optional[SystemPrompt], temperature: float,
+                                     max_tokens: Optional[int], model: Optional[str] = None) -> Dict[str, Any]:
+        """Async version of _build_fitted_request()"""
+        params = self._build_request(prompt, context, system_prompt, temperature, max_tokens, model)
+        for _ in range(CONTEXT_CONDENSE_ROUNDS):
+            if self._fits_context_window(params):
+                return params
+            context = await self._acondense_context(prompt, context)
+            params = self._build_request(prompt, context, system_prompt, temperature, max_tokens, model)
+        self._require_fit(params)
+        return params
+    
+    def _fits_context_window(self, params: Dict[str, Any]) -> bool:
+        """Check a request's prompt plus max_tokens fits the model's context window
+        
+        Requests comfortably under the limit by the character estimate skip the
+        count_tokens round trip; only ones near it are counted exactly.
+        """
+        if self._request_tokens(params) <= self.context_window * 0.8:
+            return True
+        content = params['messages'][0]['content']
+        text = content if isinstance(content, str) else "\n\n".join(block['text'] for block in content)
+        return self.estimate_tokens(text, params.get('system')) + params['max_tokens'] <= self.context_window
+    
+    def _require_fit(self, params: Dict[str, Any]):
+        """Fail before the API call if a request still exceeds the context window"""
+        if not self._fits_context_window(params):
+            raise ValueError(f"Request is too long for the {self.context_window} token context window")
+    
+    def _context_chunks(self, context: Optional[str]) -> List[str]:
+        """Split context on paragraph breaks into chunks that each fit comfortably in one request"""
+        if not context:
+            # Nothing to condense: the prompt itself is too long
+            raise ValueError(f"Request is too long for the {self.context_window} token context window")
+        
+        chunk_chars = int(self.context_window * CONTEXT_CHUNK_FRACTION) * 4
+        chunks = []
+        current = []
+        current_chars = 0
+        for paragraph in context.split("\n\n"):
+            # Hard-split paragraphs that are larger than a chunk on their own
+            for start in range(0, max(len(paragraph), 1), chunk_chars):
+                piece = paragraph[start:start + chunk_chars]
+                if current and current_chars + len(piece) > chunk_chars:
+                    chunks.append("\n\n".join(current))
+                    current, current_chars = [], 0
+                current.append(piece)
+                current_chars += len(piece) + 2
+        if current:
+            chunks.append("\n\n".join(current))
+        return chunks
+    
+    def _condense_context(self, prompt: str, context: Optional[str]) -> str:
+        """Reduce an oversized context to notes relevant to the prompt, one chunk per request"""
+        chunks = self._context_chunks(context)
+        logger.info(f"Context too long for one request, condensing {len(chunks)} chunks")
+        condense_prompt = CONDENSE_PROMPT.format(prompt=prompt)
+        with ThreadPoolExecutor(max_workers=min(len(chunks), 4)) as pool:
+            notes = pool.map(lambda chunk: self.generate(prompt=condense_prompt, context=chunk, temperature=0.3,
+                                                         model=self.model_for('summary')), chunks)
+            return "\n\n".join(notes)
+    
+    async def _acondense_context(self, prompt: str, context: Optional[str]) -> str:
+        """Async version of _condense_context()"""
+        chunks = self._context_chunks(context)
+        logger.info(f"Context too long for one request, condensing {len(chunks)} chunks")
+        condense_prompt = CONDENSE_PROMPT.format(prompt=prompt)
+        notes = await asyncio.gather(*(self.agenerate(prompt=condense_prompt, context=chunk, temperature=0.3,
+                                                      model=self.model_for('summary')) for chunk in chunks))
+        return "\n\n".join(notes)
+    
+    def _prompt_chars(self, params: Dict[str, Any]) -> int:
+        """Length of a request's user message, whether a string or content blocks"""
+        content = params['messages'][0]['content']
+        if isinstance(content, str):
+            return len(content)
+        return sum(len(block['text']) for block in content)
+    
+    def _request_tokens(self, params: Dict[str, Any]) -> int:
+        """Tokens to reserve for a request: a rough prompt estimate plus the output cap"""
+        prompt_chars = self._prompt_chars(params) + len(repr(params.get('system', '')))
+        return prompt_chars // 4 + params['max_tokens']
+    
+    def _reserve_budget(self, params: Dict[str, Any]):
+        """Wait until the rolling token/request budget has room for this request"""
+        tokens = self._request_tokens(params)
+        while True:
+            entry, wait = self.budget.reserve(tokens)
+            if entry is not None:
+                return entry
+            logger.info(f"Claude token budget reached, waiting {wait:.1f}s")
+            time.sleep(wait)
+    
+    async def _areserve_budget(self, params: Dict[str, Any]):
+        """Async version of _reserve_budget()"""
+        tokens = self._request_tokens(params)
+        while True:
+            entry, wait = self.budget.reserve(tokens)
+            if entry is not None:
+                return entry
+            logger.info(f"Claude token budget reached, waiting {wait:.1f}s")
+            await asyncio.sleep(wait)
+    
+    def _settle_budget(self, entry, message):
+        """Record the tokens a request actually used against the budget"""
+        usage = message.usage
+        self.budget.settle(entry, usage.input_tokens + usage.output_tokens +
+                           (getattr(usage, 'cache_creation_input_tokens', 0) or 0) +
+                           (getattr(usage, 'cache_read_input_tokens', 0) or 0))
+    
+    def _response_cache_key(self, params: Dict[str, Any]) -> Optional[bytes]:
+        """Cache key for a request, or None if it is too random to cache"""
+        if params["temperature"] > CACHEABLE_TEMPERATURE:
+            return None
+        request = (params["model"], params.get("system"), params["messages"],
+                   params["temperature"], params["max_tokens"])
+        return hashlib.blake2b(repr(request).encode('utf-8'), digest_size=16).digest()
+    
+    def _cached_response(self, cache_key: Optional[bytes]) -> Optional[str]:
+        """Look up a cached response, marking it most recently used"""
+        if cache_key is None:
+            return None
+        with self._response_cache_lock:
+            response_text = self._response_cache.get(cache_key)
+            if response_text is not None:
+                self._response_cache.move_to_end(cache_key)
+        if response_text is not None:
+            logger.info("Returning cached Claude response")
+        return response_text
+    
+    def _store_response(self, cache_key: Optional[bytes], response_text: str) -> str:
+        """Cache a response, evicting the least recently used when full"""
+        if cache_key is not None:
+            with self._response_cache_lock:
+                self._response_cache[cache_key] = response_text
+                self._response_cache.move_to_end(cache_key)
+                while len(self._response_cache) > RESPONSE_CACHE_SIZE:
+                    self._response_cache.popitem(last=False)
+        return response_text
+    
+    def _response_text(self, message) -> str:
+        """Extract the response text from a Claude message, joining all its text blocks"""
+        response_text = "".join(block.text for block in message.content if block.type == "text")
+        other_blocks = [block.type for block in message.content if block.type != "text"]
+        if other_blocks:
+            logger.warning(f"Claude response included non-text blocks: {other_blocks}")
+        usage = message.usage
+        logger.info(f"Claude generated {len(response_text)} characters "
+                    f"({usage.input_tokens} input, {usage.output_tokens} output tokens; "
+                    f"cache read {getattr(usage, 'cache_read_input_tokens', 0) or 0}, "
+                    f"cache write {getattr(usage, 'cache_creation_input_tokens', 0) or 0} input tokens)")
+        return response_text
+    
     def analyze(self, text: str, analysis_type: str = "summary",
                 custom_instructions: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -125,51 +644,73 @@ class ClaudeClient:
             raise Exception("Claude client not connected")
         
         try:
-            # Build analysis prompt based on type
-            analysis_prompts = {
-                "summary": "Please provide a concise summary of the following text, highlighting key points:",
-                "sentiment": "Analyze the sentiment and tone of the following text. Provide scores for: positive, negative, neutral, and identify emotional themes:",
-                "themes": "Identify and list the main themes, topics, and concepts in the following text:",
-                "key_points": "Extract the key points and important information from the following text as a bulleted list:",
-                "entities": "Identify and categorize all named entities (people, organizations, locations, dates, etc.) in the following text:",
-                "questions": "Generate relevant research questions based on the following text:",
-                "critique": "Provide a critical analysis of the arguments, evidence, and logic in the following text:"
-            }
-            
-            # Get base prompt or use custom
-            if custom_instructions:
-                prompt = custom_instructions
-            else:
-                prompt = analysis_prompts.get(analysis_type, analysis_prompts["summary"])
-            
-            # Add text to analyze
-            full_prompt = f"{prompt}\n\nText to analyze:\n{text}"
-            
-            # Add JSON formatting instruction for structured output
-            if analysis_type != "summary":
-                full_prompt += "\n\nProvide your analysis in a structured format with clear sections."
-            
-            # Generate analysis
+            system_prompt, prompt, context = self._analysis_request(text, analysis_type, custom_instructions)
+            model = self.model_for(analysis_type)
             response = self.generate(
-                prompt=full_prompt,
-                temperature=0.3  # Lower temperature for analysis tasks
+                prompt=prompt,
+                context=context,
+                system_prompt=system_prompt,
+                temperature=0.3,  # Lower temperature for analysis tasks
+                model=model
             )
+            return self._analysis_result(text, analysis_type, response, model)
             
-            # Parse response into structured format
-            result = {
-                "analysis_type": analysis_type,
-                "timestamp": datetime.now().isoformat(),
-                "content": response,
-                "text_length": len(text),
-                "model_used": self.model
-            }
-            
-            return result
+        except Exception as e:
+            logger.error(f"Error analyzing text with Claude: {e}")
+            raise
+    
+    async def aanalyze(self, text: str, analysis_type: str = "summary",
+                       custom_instructions: Optional[str] = None) -> Dict[str, Any]:
+        """Async version of analyze()"""
+        if not self.is_connected():
+            raise Exception("Claude client not connected")
+        
+        try:
+            system_prompt, prompt, context = self._analysis_request(text, analysis_type, custom_instructions)
+            model = self.model_for(analysis_type)
+            response = await self.agenerate(
+                prompt=prompt,
+                context=context,
+                system_prompt=system_prompt,
+                temperature=0.3,  # Lower temperature for analysis tasks
+                model=model
+            )
+            return self._analysis_result(text, analysis_type, response, model)
             
         except Exception as e:
             logger.error(f"Error analyzing text with Claude: {e}")
             raise
     
+    def _analysis_request(self, text: str, analysis_type: str,
+                          custom_instructions: Optional[str]) -> Tuple[SystemPrompt, str, str]:
+        """Build the (cached system prompt, user prompt, context) for an analyze() call
+        
+        The instructions go in the system prompt so they form a stable, cacheable
+        prefix; the text goes in as context, so an oversized one is condensed
+        by generate() instead of being rejected.
+        """
+        # Get base prompt or use custom
+        if custom_instructions:
+            instructions = custom_instructions
+        else:
+            instructions = ANALYSIS_PROMPTS.get(analysis_type, ANALYSIS_PROMPTS["summary"])
+        
+        # Add JSON formatting instruction for structured output
+        if analysis_type != "summary":
+            instructions += "\n\nProvide your analysis in a structured format with clear sections."
+        
+        return cached_system_prompt(instructions), "Analyze the text given as context.", text
+    
+    def _analysis_result(self, text: str, analysis_type: str, response: str, model: str) -> Dict[str, Any]:
+        """Shape an analysis response into the analyze() result dictionary"""
+        return {
+            "analysis_type": analysis_type,
+            "timestamp": datetime.now().isoformat(),
+            "content": response,
+            "text_length": len(text),
+            "model_used": model
+        }
+    
     def compare_texts(self, text1: str, text2: str, 
                       comparison_type: str = "differences") -> Dict[str, Any]:
         """
@@ -187,34 +728,77 @@ class ClaudeClient:
             raise Exception("Claude client not connected")
         
         try:
-            prompts = {
-                "differences": "Compare these two texts and highlight the key differences:",
-                "similarities": "Compare these two texts and identify the similarities and common themes:",
-                "both": "Provide a detailed comparison of these two texts, noting both similarities and differences:",
-                "factual": "Compare the factual claims in these two texts and identify any contradictions or agreements:"
-            }
-            
-            prompt = prompts.get(comparison_type, prompts["both"])
-            
-            full_prompt = f"{prompt}\n\nText 1:\n{text1}\n\nText 2:\n{text2}"
+            summarized = len(text1) + len(text2) > COMPARE_SUMMARY_CHARS
+            if summarized:
+                # Summarize both texts at once, then compare the much shorter summaries
+                with ThreadPoolExecutor(max_workers=2) as pool:
+                    summary1, summary2 = pool.map(lambda text: self.analyze(text, "summary")["content"], (text1, text2))
+                compared = (summary1, summary2)
+            else:
+                compared = (text1, text2)
             
+            system_prompt, prompt, context = self._comparison_request(*compared, comparison_type, summarized)
             response = self.generate(
-                prompt=full_prompt,
-                temperature=0.3
+                prompt=prompt,
+                context=context,
+                system_prompt=system_prompt,
+                temperature=0.3,
+                model=self.model_for('compare')
             )
+            return self._comparison_result(text1, text2, comparison_type, response, summarized)
+            
+        except Exception as e:
+            logger.error(f"Error comparing texts with Claude: {e}")
+            raise
+    
+    async def acompare_texts(self, text1: str, text2: str,
+                             comparison_type: str = "differences") -> Dict[str, Any]:
+        """Async version of compare_texts()"""
+        if not self.is_connected():
+            raise Exception("Claude client not connected")
+        
+        try:
+            summarized = len(text1) + len(text2) > COMPARE_SUMMARY_CHARS
+            if summarized:
+                summaries = await asyncio.gather(self.aanalyze(text1, "summary"), self.aanalyze(text2, "summary"))
+                compared = tuple(summary["content"] for summary in summaries)
+            else:
+                compared = (text1, text2)
             
-            return {
-                "comparison_type": comparison_type,
-                "timestamp": datetime.now().isoformat(),
-                "analysis": response,
-                "text1_length": len(text1),
-                "text2_length": len(text2)
-            }
+            system_prompt, prompt, context = self._comparison_request(*compared, comparison_type, summarized)
+            response = await self.agenerate(
+                prompt=prompt,
+                context=context,
+                system_prompt=system_prompt,
+                temperature=0.3,
+                model=self.model_for('compare')
+            )
+            return self._comparison_result(text1, text2, comparison_type, response, summarized)
             
         except Exception as e:
             logger.error(f"Error comparing texts with Claude: {e}")
             raise
     
+    def _comparison_request(self, text1: str, text2: str, comparison_type: str,
+                            summarized: bool) -> Tuple[SystemPrompt, str, str]:
+        """Build the (cached system prompt, user prompt, context) for a compare_texts() call"""
+        prompt = COMPARISON_PROMPTS.get(comparison_type, COMPARISON_PROMPTS["both"])
+        label = " summary" if summarized else ""
+        return (cached_system_prompt(prompt), f"Compare Text 1{label} and Text 2{label} given as context.",
+                f"Text 1{label}:\n{text1}\n\nText 2{label}:\n{text2}")
+    
+    def _comparison_result(self, text1: str, text2: str, comparison_type: str,
+                           response: str, summarized: bool) -> Dict[str, Any]:
+        """Shape a comparison response into the compare_texts() result dictionary"""
+        return {
+            "comparison_type": comparison_type,
+            "timestamp": datetime.now().isoformat(),
+            "analysis": response,
+            "text1_length": len(text1),
+            "text2_length": len(text2),
+            "compared_summaries": summarized
+        }
+    
     def extract_structured_data(self, text: str, schema: Dict[str, Any]) -> Dict[str, Any]:
         """
         Extract structured data from text according to a schema
@@ -230,44 +814,61 @@ class ClaudeClient:
             raise Exception("Claude client not connected")
         
         try:
-            import json
-            
-            prompt = f"""Extract information from the text according to this schema:
-{json.dumps(schema, indent=2)}
-
-Return the extracted data as valid JSON matching the schema structure.
-Only include information explicitly stated in the text.
-
-Text to process:
-{text}
-
-Extracted JSON:"""
-            
+            system_prompt, prompt, context = self._extraction_request(text, schema)
             response = self.generate(
                 prompt=prompt,
-                temperature=0.1  # Very low temperature for structured extraction
+                context=context,
+                system_prompt=system_prompt,
+                temperature=0.1,  # Very low temperature for structured extraction
+                model=self.model_for('extract')
             )
+            return self._parse_extracted_data(response)
             
-            # Try to parse as JSON
-            try:
-                # Find JSON in response (it might have explanation text around it)
-                import re
-                json_match = re.search(r'\{.*\}', response, re.DOTALL)
-                if json_match:
-                    extracted_data = json.loads(json_match.group())
-                else:
-                    # Fallback: try to parse entire response
-                    extracted_data = json.loads(response)
-            except json.JSONDecodeError:
-                logger.warning("Could not parse Claude response as JSON, returning raw text")
-                extracted_data = {"raw_response": response}
-            
-            return extracted_data
+        except Exception as e:
+            logger.error(f"Error extracting structured data with Claude: {e}")
+            raise
+    
+    async def aextract_structured_data(self, text: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+        """Async version of extract_structured_data()"""
+        if not self.is_connected():
+            raise Exception("Claude client not connected")
+        
+        try:
+            system_prompt, prompt, context = self._extraction_request(text, schema)
+            response = await self.agenerate(
+                prompt=prompt,
+                context=context,
+                system_prompt=system_prompt,
+                temperature=0.1,  # Very low temperature for structured extraction
+                model=self.model_for('extract')
+            )
+            return self._parse_extracted_data(response)
             
         except Exception as e:
             logger.error(f"Error extracting structured data with Claude: {e}")
             raise
     
+    def _extraction_request(self, text: str, schema: Dict[str, Any]) -> Tuple[SystemPrompt, str, str]:
+        """Build the (cached system prompt, user prompt, context) for an extract_structured_data() call"""
+        instructions = extraction_instructions(json.dumps(schema, indent=2))
+        return cached_system_prompt(instructions), "Process the text given as context.\n\nExtracted JSON:", text
+    
+    def _parse_extracted_data(self, response: str) -> Dict[str, Any]:
+        """Parse the JSON object out of an extraction response"""
+        # Find JSON in response (it might have explanation text around it)
+        extracted_data = find_json_object(response)
+        if extracted_data is not None:
+            return extracted_data
+        
+        try:
+            # Fallback: try to parse entire response
+            extracted_data = json.loads(response)
+        except json.JSONDecodeError:
+            logger.warning("Could not parse Claude response as JSON, returning raw text")
+            extracted_data = {"raw_response": response}
+        
+        return extracted_data
+    
     def generate_questions(self, text: str, question_type: str = "research",
                           num_questions: int = 5) -> List[str]:
         """
@@ -285,33 +886,28 @@ Extracted JSON:"""
             raise Exception("Claude client not connected")
         
         try:
-            question_prompts = {
-                "research": f"Generate {num_questions} research questions that could be explored based on this text:",
-                "comprehension": f"Generate {num_questions} comprehension questions to test understanding of this text:",
-                "critical": f"Generate {num_questions} critical thinking questions that challenge the assumptions in this text:",
-                "followup": f"Generate {num_questions} follow-up questions for further investigation based on this text:"
-            }
-            
-            prompt = question_prompts.get(question_type, question_prompts["research"])
-            full_prompt = f"{prompt}\n\n{text}\n\nQuestions (one per line):"
+            prompt = QUESTION_PROMPTS.get(question_type, QUESTION_PROMPTS["research"]).format(num_questions=num_questions)
             
             response = self.generate(
-                prompt=full_prompt,
-                temperature=0.8  # Higher temperature for creative question generation
+                prompt=f"{text}\n\nQuestions (one per line):",
+                system_prompt=cached_system_prompt(prompt),
+                temperature=0.8,  # Higher temperature for creative question generation
+                model=self.model_for('questions')
             )
             
             # Parse questions from response
             questions = []
-            for line in response.split('\n'):
+            for line in response.splitlines():
                 line = line.strip()
                 if line and not line.startswith('#'):
                     # Remove numbering if present
-                    import re
-                    line = re.sub(r'^\d+[\.\)]\s*', '', line)
+                    line = QUESTION_NUMBER_RE.sub('', line, count=1)
                     if line:
                         questions.append(line)
+                        if len(questions) == num_questions:
+                            break
             
-            return questions[:num_questions]
+            return questions
             
         except Exception as e:
             logger.error(f"Error generating questions with Claude: {e}")
@@ -319,7 +915,8 @@ Extracted JSON:"""
     
     def batch_process(self, items: List[Dict[str, Any]], 
                       operation: str = "summarize",
-                      batch_size: int = 5) -> List[Dict[str, Any]]:
+                      batch_size: int = 5,
+                      urgent: bool = True) -> List[Dict[str, Any]]:
         """
         Process multiple items in batches
         
@@ -327,6 +924,8 @@ Extracted JSON:"""
             items: List of items to process
             operation: Operation to perform on each item
             batch_size: Number of items to process at once
+            urgent: Call the API directly; set False to submit everything as one
+                Message Batch instead (half price, but may take minutes to hours)
             
         Returns:
             List of processed results
@@ -334,48 +933,251 @@ Extracted JSON:"""
         if not self.is_connected():
             raise Exception("Claude client not connected")
         
+        if not urgent:
+            return self.message_batch_process(items, operation)
+        
         results = []
+        unique_items, item_map = self._dedupe_items(items, operation)
         
         try:
-            for i in range(0, len(items), batch_size):
-                batch = items[i:i + batch_size]
-                logger.info(f"Processing batch {i//batch_size + 1} of {len(items)//batch_size + 1}")
-                
-                for item in batch:
-                    if operation == "summarize":
-                        result = self.analyze(item.get('text', ''), 'summary')
-                    elif operation == "extract":
-                        result = self.extract_structured_data(
-                            item.get('text', ''),
-                            item.get('schema', {})
-                        )
-                    else:
-                        result = {"error": f"Unknown operation: {operation}"}
+            # Items in a batch run concurrently (the SDK calls release the GIL
+            # while waiting on the network); map keeps results in item order
+            with ThreadPoolExecutor(max_workers=max(1, min(batch_size, len(unique_items)))) as pool:
+                for i in range(0, len(unique_items), batch_size):
+                    batch = unique_items[i:i + batch_size]
+                    logger.info(f"Processing batch {i//batch_size + 1} of {len(unique_items)//batch_size + 1}")
                     
-                    result['item_id'] = item.get('id', f"item_{i}")
-                    results.append(result)
+                    results.extend(pool.map(lambda item: self._process_item(item, operation, i), batch))
+            
+            # Default ids name the start of the item's batch, as before deduplication
+            return self._expand_results(items, item_map, results,
+                                        lambda index: f"item_{index - index % batch_size}")
+            
+        except Exception as e:
+            logger.error(f"Error in batch processing with Claude: {e}")
+            raise
+    
+    async def abatch_process(self, items: List[Dict[str, Any]],
+                             operation: str = "summarize") -> List[Dict[str, Any]]:
+        """
+        Process multiple items concurrently, at most self.concurrency at a time
+        
+        Args:
+            items: List of items to process
+            operation: Operation to perform on each item
             
-            return results
+        Returns:
+            List of processed results, in the same order as items
+        """
+        if not self.is_connected():
+            raise Exception("Claude client not connected")
+        
+        # Created here so it belongs to the running event loop
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def process(item, index):
+            async with semaphore:
+                return await self._aprocess_item(item, operation, index)
+        
+        unique_items, item_map = self._dedupe_items(items, operation)
+        
+        try:
+            logger.info(f"Processing {len(unique_items)} items with up to {self.concurrency} concurrent requests")
+            results = await asyncio.gather(*(process(item, index) for index, item in enumerate(unique_items)))
+            return self._expand_results(items, item_map, results, lambda index: f"item_{index}")
             
         except Exception as e:
             logger.error(f"Error in batch processing with Claude: {e}")
             raise
     
+    def message_batch_process(self, items: List[Dict[str, Any]],
+                              operation: str = "summarize",
+                              poll_interval: float = 30.0) -> List[Dict[str, Any]]:
+        """
+        Process items through the Message Batches API and wait for the results
+        
+        Args:
+            items: List of items to process
+            operation: Operation to perform on each item (summarize or extract)
+            poll_interval: Seconds between batch status checks
+            
+        Returns:
+            List of processed results, in the same order as items
+        """
+        if not self.is_connected():
+            raise Exception("Claude client not connected")
+        
+        if operation not in ("summarize", "extract"):
+            return [{"error": f"Unknown operation: {operation}", "item_id": item.get('id', f"item_{index}")}
+                    for index, item in enumerate(items)]
+        
+        all_items = items
+        items, item_map = self._dedupe_items(all_items, operation)
+        
+        try:
+            # custom_id must be short and URL-safe, so use positions and map back
+            requests = []
+            for index, item in enumerate(items):
+                if operation == "summarize":
+                    system_prompt, prompt, context = self._analysis_request(item.get('text', ''), 'summary', None)
+                    temperature, model = 0.3, self.model_for('summary')
+                else:
+                    system_prompt, prompt, context = self._extraction_request(item.get('text', ''), item.get('schema', {}))
+                    temperature, model = 0.1, self.model_for('extract')
+                requests.append({
+                    "custom_id": f"item_{index}",
+                    "params": self._build_request(prompt, context, system_prompt, temperature, None, model)
+                })
+            
+            batch = self.client.messages.batches.create(requests=requests)
+            logger.info(f"Submitted message batch {batch.id} with {len(requests)} requests")
+            
+            while batch.processing_status != "ended":
+                time.sleep(poll_interval)
+                batch = self.client.messages.batches.retrieve(batch.id)
+            
+            responses = {entry.custom_id: entry.result for entry in self.client.messages.batches.results(batch.id)}
+            
+            results = []
+            for index, item in enumerate(items):
+                outcome = responses.get(f"item_{index}")
+                if outcome is None or outcome.type != "succeeded":
+                    result = {"error": f"Batch request {getattr(outcome, 'type', 'missing')}"}
+                elif operation == "summarize":
+                    result = self._analysis_result(item.get('text', ''), 'summary', self._response_text(outcome.message),
+                                                   self.model_for('summary'))
+                else:
+                    result = self._parse_extracted_data(self._response_text(outcome.message))
+                result['item_id'] = item.get('id', f"item_{index}")
+                results.append(result)
+            
+            logger.info(f"Message batch {batch.id} finished: {batch.request_counts}")
+            return self._expand_results(all_items, item_map, results, lambda index: f"item_{index}")
+            
+        except Exception as e:
+            logger.error(f"Error in message batch processing with Claude: {e}")
+            raise
+    
+    def _dedupe_items(self, items: List[Dict[str, Any]], operation: str) -> Tuple[List[Dict[str, Any]], List[int]]:
+        """Drop items whose inputs repeat an earlier item's
+        
+        Returns:
+            tuple: (unique items, index into the unique items for each original item)
+        """
+        unique_items = []
+        item_map = []
+        seen = {}
+        for item in items:
+            inputs = (operation, item.get('text', ''), json.dumps(item.get('schema', {}), sort_keys=True, default=str))
+            key = hashlib.blake2b(repr(inputs).encode('utf-8'), digest_size=16).digest()
+            if key not in seen:
+                seen[key] = len(unique_items)
+                unique_items.append(item)
+            item_map.append(seen[key])
+        
+        if len(unique_items) < len(items):
+            logger.info(f"Skipping {len(items) - len(unique_items)} duplicate batch items")
+        return unique_items, item_map
+    
+    def _expand_results(self, items: List[Dict[str, Any]], item_map: List[int],
+                        unique_results: List[Dict[str, Any]], default_id) -> List[Dict[str, Any]]:
+        """Fan results for the unique items back out to every original item, in order"""
+        results = []
+        for index, (item, unique_index) in enumerate(zip(items, item_map)):
+            result = dict(unique_results[unique_index])
+            result['item_id'] = item.get('id', default_id(index))
+            results.append(result)
+        return results
+    
+    def _process_item(self, item: Dict[str, Any], operation: str, index: int) -> Dict[str, Any]:
+        """Run a batch operation on a single item"""
+        if operation == "summarize":
+            result = self.analyze(item.get('text', ''), 'summary')
+        elif operation == "extract":
+            result = self.extract_structured_data(
+                item.get('text', ''),
+                item.get('schema', {})
+            )
+        else:
+            result = {"error": f"Unknown operation: {operation}"}
+        
+        result['item_id'] = item.get('id', f"item_{index}")
+        return result
+    
+    async def _aprocess_item(self, item: Dict[str, Any], operation: str, index: int) -> Dict[str, Any]:
+        """Async version of _process_item()"""
+        if operation == "summarize":
+            result = await self.aanalyze(item.get('text', ''), 'summary')
+        elif operation == "extract":
+            result = await self.aextract_structured_data(
+                item.get('text', ''),
+                item.get('schema', {})
+            )
+        else:
+            result = {"error": f"Unknown operation: {operation}"}
+        
+        result['item_id'] = item.get('id', f"item_{index}")
+        return result
+    
+    def model_for(self, task: str) -> str:
+        """Model to use for a task (an analysis type, 'questions', 'compare' or 'extract')"""
+        return self.model_map.get(task, self.model)
+    
+    def _load_model_map(self) -> Dict[str, str]:
+        """Per-task models: summaries/questions on CLAUDE_FAST_MODEL, then CLAUDE_MODEL_MAP overrides"""
+        fast_model = os.environ.get('CLAUDE_FAST_MODEL', 'claude-3-5-haiku-20241022')
+        model_map = {"summary": fast_model, "questions": fast_model} if fast_model else {}
+        
+        overrides = os.environ.get('CLAUDE_MODEL_MAP')
+        if overrides:
+            try:
+                model_map.update(json.loads(overrides))
+            except (json.JSONDecodeError, TypeError, ValueError) as e:
+                logger.warning(f"Ignoring invalid CLAUDE_MODEL_MAP: {e}")
+        return model_map
+    
     def get_model_info(self) -> Dict[str, Any]:
         """Get information about the current model configuration"""
         return {
             "connected": self.is_connected(),
             "model": self.model,
+            "model_map": dict(self.model_map),
             "max_tokens": self.max_tokens,
             "api_key_configured": bool(self.api_key and self.api_key != 'your_claude_api_key_here')
         }
     
-    def estimate_tokens(self, text: str) -> int:
+    def estimate_tokens(self, text: str, system_prompt: Optional[SystemPrompt] = None) -> int:
         """
-        Estimate token count for text (rough approximation)
-        Claude uses ~1 token per 4 characters on average
+        Count the input tokens for text with Claude's tokenizer
+        
+        Uses the (free) count_tokens endpoint, caching counts per text, and falls
+        back to the ~4 characters per token approximation when offline or if
+        the endpoint fails. The count includes the few tokens of message framing.
         """
-        return len(text) // 4
+        if not self.is_connected():
+            return len(text) // 4
+        
+        key = hashlib.blake2b(repr((self.model, system_prompt, text)).encode('utf-8'), digest_size=16).digest()
+        with self._token_count_cache_lock:
+            count = self._token_count_cache.get(key)
+            if count is not None:
+                self._token_count_cache.move_to_end(key)
+                return count
+        
+        try:
+            params = {"model": self.model, "messages": [{"role": "user", "content": text}]}
+            if system_prompt:
+                params["system"] = system_prompt
+            count = self.client.messages.count_tokens(**params).input_tokens
+        except Exception as e:
+            logger.warning(f"Token count request failed, using estimate: {e}")
+            return len(text) // 4
+        
+        with self._token_count_cache_lock:
+            self._token_count_cache[key] = count
+            while len(self._token_count_cache) > TOKEN_COUNT_CACHE_SIZE:
+                self._token_count_cache.popitem(last=False)
+        return count
     
     def check_token_limit(self, text: str, limit: Optional[int] = None) -> bool:
         """Check if text is within token limits"""
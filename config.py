@@ -2,27 +2,123 @@
 Configuration and setup for the Promotion Letters Tool
 """
 
+import io
 import os
+import re
 import logging
-import anthropic
-from flask import Flask
+import tempfile
+from functools import lru_cache
+import orjson
+from flask import Flask, Request
+from flask.json.provider import DefaultJSONProvider
+from flask.sessions import SecureCookieSessionInterface
+from flask_caching import Cache
+from werkzeug.routing import BaseConverter
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from utils import SUPPORTED_EXTENSIONS
+
+# Rate limits (Flask-Limiter notation)
+DEFAULT_RATE_LIMIT = "100 per hour"
+API_RATE_LIMIT = "5 per minute"          # Page API calls (uploads + Claude)
+DATA_WRITE_RATE_LIMIT = "10 per minute"  # Saving and deleting page data
+
+# Uploaded file parts are spooled to a temporary file once they exceed this size
+UPLOAD_SPOOL_SIZE = 64 * 1024
+
+class DiscardingStream(io.BytesIO):
+    """Upload part sink that accepts the parser's writes but keeps nothing"""
+    
+    def write(self, data):
+        return len(data)
+
+class UploadRequest(Request):
+    """Request class that keeps multipart uploads out of worker memory"""
+    
+    # Non-file form fields are always held in memory, so cap them separately
+    # from MAX_CONTENT_LENGTH (Werkzeug leaves this unbounded by default)
+    max_form_memory_size = 2 * 1024 * 1024
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        """Spool each uploaded file part to disk as it is parsed"""
+        # Parts we will reject anyway are drained without being buffered or
+        # written to disk; validation still reports them by field name
+        if filename and os.path.splitext(filename.lower())[1] not in SUPPORTED_EXTENSIONS:
+            return DiscardingStream()
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE, mode='rb+')
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that encodes and decodes with orjson
+    
+    Keys are still sorted, and dates, Decimals etc. go through Flask's default
+    conversions so responses look the same as with the stdlib provider.
+    """
+    
+    option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    
+    def _dumps_bytes(self, obj, option=0):
+        return orjson.dumps(obj, default=self.default, option=self.option | option)
+    
+    def dumps(self, obj, **kwargs):
+        # Callers asking for stdlib options (indent, separators, ...) get the stdlib encoder
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._dumps_bytes(obj).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = orjson.OPT_APPEND_NEWLINE
+        if self.compact is False or (self.compact is None and self._app.debug):
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(self._dumps_bytes(obj, option), mimetype=self.mimetype)
+
+# Paths that never use the session: favicon, health probes, static and binary file downloads
+SESSIONLESS_PATH_RE = re.compile(r'^/(?:favicon\.ico|health|static/.+|api/[^/]+/file/[^/]+)$')
+
+class FilteringSessionInterface(SecureCookieSessionInterface):
+    """Cookie sessions, skipped entirely for paths that don't need one"""
+    
+    def open_session(self, app, request):
+        if SESSIONLESS_PATH_RE.match(request.path):
+            return self.make_null_session(app)
+        return super().open_session(app, request)
+
+class PageNameConverter(BaseConverter):
+    """URL converter for page names - letters, digits, '-' and '_' only"""
+    regex = r'[A-Za-z0-9_-]+'
 
 def create_app():
     """Create and configure Flask application"""
     app = Flask(__name__)
+    app.request_class = UploadRequest
+    app.json = OrjsonProvider(app)
+    app.session_interface = FilteringSessionInterface()
+    
+    # Page routes use <page:page_name> so dotted or malformed paths 404 in the router
+    app.url_map.converters['page'] = PageNameConverter
     
     # Simple configuration without external dependencies
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-this')
     app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 10MB max file size
     
+    # Files go out through gunicorn's sendfile() by default; behind a front-end
+    # server that understands X-Sendfile, hand the path to it instead
+    app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
+    
     return app
 
 def setup_logging():
     """Configure application logging"""
+    # Outside debug mode, don't print tracebacks for errors raised while emitting records
+    logging.raiseExceptions = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
+    
     logging.basicConfig(
-        level=logging.INFO,
+        level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         handlers=[
             logging.FileHandler('logs/app.log'),
@@ -32,17 +128,41 @@ def setup_logging():
     return logging.getLogger(__name__)
 
 def setup_rate_limiter(app):
-    """Configure rate limiting"""
+    """Configure rate limiting
+    
+    Counters live in RATELIMIT_STORAGE_URL (Redis in docker-compose) so limits are
+    shared by all gunicorn workers; without it they fall back to per-process memory.
+    """
     limiter = Limiter(
         app=app,
         key_func=get_remote_address,
-        default_limits=["100 per hour"]
+        default_limits=[DEFAULT_RATE_LIMIT],
+        storage_uri=os.environ.get('RATELIMIT_STORAGE_URL', 'memory://'),
+        # fixed-window is a single INCR+EXPIRE per hit; moving-window runs a Lua script over a list
+        strategy=os.environ.get('RATELIMIT_STRATEGY', 'fixed-window'),
+        # Keep serving (with per-process limits) if Redis is unreachable
+        in_memory_fallback_enabled=True
     )
     return limiter
 
-def setup_claude_client():
-    """Initialize Claude API client"""
+def setup_cache(app):
+    """Configure response caching (in-process by default)"""
+    cache = Cache(app, config={
+        'CACHE_TYPE': os.environ.get('CACHE_TYPE', 'SimpleCache'),
+        'CACHE_DEFAULT_TIMEOUT': int(os.environ.get('CACHE_DEFAULT_TIMEOUT', '30')),
+        'CACHE_REDIS_URL': os.environ.get('REDIS_URL')
+    })
+    return cache
+
+def claude_configured():
+    """Check whether a Claude API key is configured, without creating the client"""
+    return bool(os.environ.get('CLAUDE_API_KEY'))
+
+@lru_cache(maxsize=1)
+def get_claude_client():
+    """Create the Claude API client on first use and reuse it afterwards"""
     try:
+        import anthropic
         client = anthropic.Anthropic(
             api_key=os.environ.get('CLAUDE_API_KEY')
         )
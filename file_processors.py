@@ -7,11 +7,44 @@ import io
 import logging
 import zipfile
 import json
+import atexit
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from docx import Document
 import PyPDF2
+from utils import directory_exists
 
 logger = logging.getLogger(__name__)
 
+# Extracted server file content, keyed by file type and SHA-256 of the file bytes
+SERVER_FILE_CACHE_SIZE = 64
+_server_file_cache = OrderedDict()
+_server_file_cache_lock = threading.Lock()
+
+# Server file path -> ((mtime_ns, size), extracted content), checked before reading the file
+_server_file_stat_cache = OrderedDict()
+
+# Process pool used when one request uploads several .docx/.pdf files
+EXTRACTION_WORKERS = int(os.environ.get('EXTRACTION_WORKERS', '2'))
+EXTRACTION_TIMEOUT = 60  # seconds per file
+_extraction_pool = None
+_extraction_pool_lock = threading.Lock()
+
+# Read size used when hashing file contents
+HASH_CHUNK_SIZE = 64 * 1024
+
+# Uploads are limited to 10MB (also enforced by MAX_CONTENT_LENGTH)
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+
+# Leading bytes expected for each binary upload type (.docx is a zip archive)
+UPLOAD_SIGNATURES = {
+    'docx': b'PK\x03\x04',
+    'pdf': b'%PDF',
+}
+
 def extract_text_from_docx(file_stream):
     """Extract text from Word document"""
     try:
@@ -33,7 +66,7 @@ def extract_text_from_docx(file_stream):
         
         return '\n'.join(text)
     except Exception as e:
-        logger.error(f"Error extracting text from DOCX: {e}")
+        logger.error("Error extracting text from DOCX: %s", e)
         raise ValueError(f"Failed to extract text from Word document: {str(e)}")
 
 def extract_xml_from_docx(file_stream):
@@ -70,7 +103,7 @@ def extract_xml_from_docx(file_stream):
         
         return xml_data
     except Exception as e:
-        logger.error(f"Error extracting XML from DOCX: {e}")
+        logger.error("Error extracting XML from DOCX: %s", e)
         return {"error": f"Failed to extract XML structure: {str(e)}"}
 
 def extract_text_from_pdf(file_stream):
@@ -85,7 +118,7 @@ def extract_text_from_pdf(file_stream):
                     text.append(f"--- Page {page_num + 1} ---")
                     text.append(page_text.strip())
             except Exception as e:
-                logger.warning(f"Error extracting text from page {page_num + 1}: {e}")
+                logger.warning("Error extracting text from page %s: %s", page_num + 1, e)
                 continue
         
         if not text:
@@ -93,7 +126,7 @@ def extract_text_from_pdf(file_stream):
         
         return '\n'.join(text)
     except Exception as e:
-        logger.error(f"Error extracting text from PDF: {e}")
+        logger.error("Error extracting text from PDF: %s", e)
         raise ValueError(f"Failed to extract text from PDF document: {str(e)}")
 
 def extract_form_data_from_pdf(file_stream):
@@ -144,14 +177,14 @@ def extract_form_data_from_pdf(file_stream):
                 
                 page_info.append(page_data)
             except Exception as e:
-                logger.warning(f"Error extracting info from page {page_num + 1}: {e}")
+                logger.warning("Error extracting info from page %s: %s", page_num + 1, e)
                 continue
         
         form_data['page_info'] = page_info
         
         return form_data
     except Exception as e:
-        logger.error(f"Error extracting form data from PDF: {e}")
+        logger.error("Error extracting form data from PDF: %s", e)
         return {"error": f"Failed to extract PDF form data: {str(e)}"}
 
 def process_uploaded_file(file):
@@ -198,6 +231,106 @@ def process_uploaded_file(file):
     
     return result
 
+def _extract_binary_server_file(file_type, file_stream):
+    """Extract content and structure from a seekable .docx or .pdf binary stream"""
+    result = {}
+    
+    if file_type == 'docx':
+        file_stream.seek(0)
+        result['text_content'] = extract_text_from_docx(file_stream)
+        
+        file_stream.seek(0)
+        result['xml_structure'] = extract_xml_from_docx(file_stream)
+        
+    elif file_type == 'pdf':
+        file_stream.seek(0)
+        result['text_content'] = extract_text_from_pdf(file_stream)
+        
+        file_stream.seek(0)
+        result['form_data'] = extract_form_data_from_pdf(file_stream)
+    
+    result['file_type'] = file_type
+    return result
+
+def _hash_stream(file_stream):
+    """SHA-256 of a binary stream, read in chunks from the start"""
+    digest = hashlib.sha256()
+    file_stream.seek(0)
+    for chunk in iter(lambda: file_stream.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+def _cache_lookup(cache_key):
+    """Copy of a cached extraction result, or None"""
+    with _server_file_cache_lock:
+        cached = _server_file_cache.get(cache_key)
+        if cached is not None:
+            _server_file_cache.move_to_end(cache_key)
+            return dict(cached)
+    return None
+
+def _cache_store(cache_key, result):
+    """Remember an extraction result, evicting the least recently used entries"""
+    with _server_file_cache_lock:
+        _server_file_cache[cache_key] = result
+        _server_file_cache.move_to_end(cache_key)
+        while len(_server_file_cache) > SERVER_FILE_CACHE_SIZE:
+            _server_file_cache.popitem(last=False)
+
+def _get_cached_extraction(file_type, file_stream):
+    """Return extracted file content, reusing results for unchanged file contents"""
+    cache_key = (file_type, _hash_stream(file_stream))
+    
+    cached = _cache_lookup(cache_key)
+    if cached is not None:
+        return cached
+    
+    result = _extract_binary_server_file(file_type, file_stream)
+    _cache_store(cache_key, result)
+    
+    # Hand out a copy so callers can't modify the cached entry
+    return dict(result)
+
+def _extract_binary_bytes(file_type, file_bytes):
+    """Extraction entry point for the process pool (file streams can't be pickled)"""
+    return _extract_binary_server_file(file_type, io.BytesIO(file_bytes))
+
+def _get_extraction_pool():
+    """Process pool for parsing several uploads at once, created on first use"""
+    global _extraction_pool
+    with _extraction_pool_lock:
+        if _extraction_pool is None:
+            # spawn, not fork: the server's worker processes are multi-threaded
+            _extraction_pool = ProcessPoolExecutor(
+                max_workers=EXTRACTION_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            atexit.register(_extraction_pool.shutdown, wait=False, cancel_futures=True)
+        return _extraction_pool
+
+def _get_server_file_extraction(file_type, file_path):
+    """Extract a server file, skipping the read entirely while its mtime and size are unchanged"""
+    stat = os.stat(file_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    
+    with _server_file_cache_lock:
+        cached = _server_file_stat_cache.get(file_path)
+        if cached is not None and cached[0] == signature:
+            _server_file_stat_cache.move_to_end(file_path)
+            return dict(cached[1])
+    
+    # Changed or unseen: fall back to the content-hash cache
+    with open(file_path, 'rb') as f:
+        result = _get_cached_extraction(file_type, f)
+    
+    with _server_file_cache_lock:
+        _server_file_stat_cache[file_path] = (signature, dict(result))
+        _server_file_stat_cache.move_to_end(file_path)
+        while len(_server_file_stat_cache) > SERVER_FILE_CACHE_SIZE:
+            _server_file_stat_cache.popitem(last=False)
+    
+    return result
+
 def process_server_file(file_path):
     """Process server-stored file and extract both content and structure"""
     if not os.path.exists(file_path):
@@ -207,41 +340,22 @@ def process_server_file(file_path):
     result = {}
     
     try:
-        if filename.endswith('.docx'):
-            with open(file_path, 'rb') as f:
-                file_stream = io.BytesIO(f.read())
-                
-                file_stream.seek(0)
-                result['text_content'] = extract_text_from_docx(file_stream)
-                
-                file_stream.seek(0)
-                result['xml_structure'] = extract_xml_from_docx(file_stream)
-                
-                result['file_type'] = 'docx'
-                
-        elif filename.endswith('.pdf'):
-            with open(file_path, 'rb') as f:
-                file_stream = io.BytesIO(f.read())
-                
-                file_stream.seek(0)
-                result['text_content'] = extract_text_from_pdf(file_stream)
-                
-                file_stream.seek(0)
-                result['form_data'] = extract_form_data_from_pdf(file_stream)
-                
-                result['file_type'] = 'pdf'
+        if filename.endswith('.docx') or filename.endswith('.pdf'):
+            # Extraction is expensive, so results are cached by content hash
+            file_type = 'docx' if filename.endswith('.docx') else 'pdf'
+            result = _get_server_file_extraction(file_type, file_path)
                 
         elif filename.endswith('.txt'):
             with open(file_path, 'r', encoding='utf-8') as f:
                 result['text_content'] = f.read()
                 result['file_type'] = 'txt'
         else:
-            logger.warning(f"Unsupported server file type: {file_path}")
+            logger.warning("Unsupported server file type: %s", file_path)
             return None
             
         return result
     except Exception as e:
-        logger.error(f"Error processing server file {file_path}: {e}")
+        logger.error("Error processing server file %s: %s", file_path, e)
         return None
 
 def validate_file(file):
@@ -266,6 +380,103 @@ def validate_file(file):
     
     return True, "File is valid"
 
+def _check_upload(file):
+    """Validate an uploaded file's name, size and leading bytes
+    
+    Returns:
+        tuple: (is_valid, message, file_type)
+    """
+    if not file or not file.filename:
+        return False, "No file provided", None
+    
+    file_type = os.path.splitext(file.filename.lower())[1].lstrip('.')
+    if file_type not in ('docx', 'pdf', 'txt'):
+        return False, "Only .docx, .pdf, and .txt files are supported", None
+    
+    # The upload is already spooled (to disk when large), so work on it in place
+    file_stream = file.stream
+    file_stream.seek(0, 2)
+    size = file_stream.tell()
+    file_stream.seek(0)
+    
+    if size > MAX_UPLOAD_SIZE:
+        return False, "File size must be less than 10MB", None
+    
+    if size == 0:
+        return False, "File is empty", None
+    
+    if file_type != 'txt':
+        # Check the content matches the extension before handing it to a parser
+        head = file_stream.read(1024)
+        signature = UPLOAD_SIGNATURES[file_type]
+        if not (head.startswith(signature) or (file_type == 'pdf' and signature in head)):
+            return False, f"File content is not a valid .{file_type} file", None
+    
+    return True, "File is valid", file_type
+
+def process_and_validate_uploads(uploads):
+    """Validate and extract several uploads, parsing uncached .docx/.pdf files in parallel
+    
+    Every upload is validated before anything is extracted. If one fails, only that
+    upload is returned.
+    
+    Args:
+        uploads: List of (field_name, file) pairs
+        
+    Returns:
+        list: (field_name, file, is_valid, message, result) in upload order. result is the
+        extracted file data, or the exception raised while extracting it.
+    """
+    results = []
+    for field_name, file in uploads:
+        is_valid, message, file_type = _check_upload(file)
+        if not is_valid:
+            return [(field_name, file, False, message, None)]
+        results.append([field_name, file, file_type, message, None])
+    
+    pending = []  # (index, cache_key, file_type, file) still to extract
+    for index, (_, file, file_type, _, _) in enumerate(results):
+        try:
+            if file_type == 'txt':
+                file.stream.seek(0)
+                results[index][4] = {'text_content': file.stream.read().decode('utf-8'), 'file_type': 'txt'}
+            else:
+                cache_key = (file_type, _hash_stream(file.stream))
+                results[index][4] = _cache_lookup(cache_key)
+                if results[index][4] is None:
+                    pending.append((index, cache_key, file_type, file))
+        except Exception as e:
+            results[index][4] = e
+    
+    # A single file isn't worth the round trip to another process, so it is parsed
+    # straight from its upload stream; only pool jobs need the bytes read into memory
+    futures = [None] * len(pending)
+    if len(pending) > 1:
+        try:
+            pool = _get_extraction_pool()
+            futures = []
+            for _, _, file_type, file in pending:
+                file.stream.seek(0)
+                futures.append(pool.submit(_extract_binary_bytes, file_type, file.stream.read()))
+        except Exception as e:
+            logger.warning("Extraction pool unavailable, extracting uploads in-process: %s", e)
+            futures = [None] * len(pending)
+    
+    for (index, cache_key, file_type, file), future in zip(pending, futures):
+        try:
+            if future is None:
+                # Already hashed into cache_key above, so parse without hashing again
+                extracted = _extract_binary_server_file(file_type, file.stream)
+            else:
+                extracted = future.result(timeout=EXTRACTION_TIMEOUT)
+            _cache_store(cache_key, extracted)
+            results[index][4] = dict(extracted)
+        except Exception as e:
+            results[index][4] = e
+    
+    return [(field_name, file, True, message, result)
+            for field_name, file, _, message, result in results]
+
 def load_server_files(page_name, directories=None):
     """Load all files from the server directory/directories for this page
     
@@ -286,54 +497,54 @@ def load_server_files(page_name, directories=None):
     if len(directories) == 1:
         server_dir = f"/app/server_files/{directories[0]}"
         
-        logger.info(f"Looking for server files in: {server_dir}")
+        logger.debug("Looking for server files in: %s", server_dir)
         
-        if not os.path.exists(server_dir):
-            logger.warning(f"No server files directory found for page: {directories[0]} at path: {server_dir}")
+        if not directory_exists(server_dir):
+            logger.warning("No server files directory found for page: %s at path: %s", directories[0], server_dir)
             return server_files
         
         try:
             all_files = os.listdir(server_dir)
-            logger.info(f"Files found in directory: {all_files}")
+            logger.debug("Files found in directory: %s", all_files)
             
             for filename in all_files:
                 file_path = os.path.join(server_dir, filename)
-                logger.info(f"Processing file: {file_path}")
+                logger.debug("Processing file: %s", file_path)
                 
                 if os.path.isfile(file_path):
-                    logger.info(f"File {filename} is a regular file, attempting to process...")
+                    logger.debug("File %s is a regular file, attempting to process...", filename)
                     file_data = process_server_file(file_path)
                     if file_data:
                         # Use filename without extension as key
                         file_key = os.path.splitext(filename)[0].replace('_', ' ').replace('-', ' ')
                         server_files[file_key] = file_data
-                        logger.info(f"Successfully loaded server file: {filename} as key: {file_key}")
+                        logger.debug("Successfully loaded server file: %s as key: %s", filename, file_key)
                     else:
-                        logger.warning(f"Failed to extract content from file: {filename}")
+                        logger.warning("Failed to extract content from file: %s", filename)
                 else:
-                    logger.info(f"Skipping {filename} - not a regular file")
+                    logger.debug("Skipping %s - not a regular file", filename)
             
-            logger.info(f"Total server files loaded for page {page_name}: {len(server_files)}")
-            if server_files:
-                logger.info(f"Server file keys: {list(server_files.keys())}")
+            logger.info("Total server files loaded for page %s: %s", page_name, len(server_files))
+            if server_files and logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Server file keys: %s", list(server_files.keys()))
         
         except Exception as e:
-            logger.error(f"Error loading server files for page {page_name}: {e}")
+            logger.error("Error loading server files for page %s: %s", page_name, e)
     
     else:
         # Multiple directories mode - prefix with directory name
-        logger.info(f"Loading server files from multiple directories for page {page_name}: {directories}")
+        logger.info("Loading server files from multiple directories for page %s: %s", page_name, directories)
         
         for directory in directories:
             server_dir = f"/app/server_files/{directory}"
             
-            if not os.path.exists(server_dir):
-                logger.info(f"Directory {server_dir} does not exist, skipping")
+            if not directory_exists(server_dir):
+                logger.debug("Directory %s does not exist, skipping", server_dir)
                 continue
             
             try:
                 all_files = os.listdir(server_dir)
-                logger.info(f"Files found in {directory}: {all_files}")
+                logger.debug("Files found in %s: %s", directory, all_files)
                 
                 for filename in all_files:
                     file_path = os.path.join(server_dir, filename)
@@ -351,20 +562,20 @@ def load_server_files(page_name, directories=None):
                             
                             # Handle potential key conflicts
                             if file_key in server_files:
-                                logger.warning(f"Key conflict for {file_key}, keeping first occurrence")
+                                logger.warning("Key conflict for %s, keeping first occurrence", file_key)
                                 continue
                             
                             server_files[file_key] = file_data
-                            logger.info(f"Loaded {filename} from {directory} as '{file_key}'")
+                            logger.debug("Loaded %s from %s as '%s'", filename, directory, file_key)
                         else:
-                            logger.warning(f"Failed to extract content from {directory}/{filename}")
+                            logger.warning("Failed to extract content from %s/%s", directory, filename)
                 
             except Exception as e:
-                logger.error(f"Error loading files from directory {directory}: {e}")
+                logger.error("Error loading files from directory %s: %s", directory, e)
                 continue
         
-        logger.info(f"Total server files loaded from all directories: {len(server_files)}")
-        if server_files:
-            logger.info(f"All server file keys: {list(server_files.keys())}")
+        logger.info("Total server files loaded from all directories: %s", len(server_files))
+        if server_files and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("All server file keys: %s", list(server_files.keys()))
     
     return server_files
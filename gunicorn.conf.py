@@ -0,0 +1,30 @@
+"""
+Gunicorn configuration for the Multi-API Research Platform
+"""
+
+import os
+
+# Bind to the same port the Flask development server used
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Requests spend most of their time waiting on Claude/PubMed/Asana, so each
+# worker runs a thread pool and overlaps those outbound calls. Set
+# GUNICORN_WORKER_CLASS=gevent to multiplex many more connections per worker
+# on greenlets instead (gunicorn monkey-patches before loading the app).
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# Claude responses for long documents can take well over the 30s default
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+# Live reload in development mode
+reload = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
+
+# Log to stdout/stderr so docker-compose logs picks them up
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
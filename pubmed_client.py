@@ -3,21 +3,238 @@ PubMed API client wrapper for biomedical literature search and retrieval
 """
 
 import os
+import re
+import asyncio
 import logging
+import httpx
 import requests
-import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
 import time
-import json
+import threading
+from collections import OrderedDict
+from operator import methodcaller
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 from urllib.parse import quote
 
+try:
+    # libxml2 parses and searches efetch XML several times faster than ElementTree
+    from lxml import etree as ET
+    HAVE_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    HAVE_LXML = False
+
 logger = logging.getLogger(__name__)
 
 
+def _field_query(values: List[str], tag: str, joiner: str = ' OR ',
+                 quote: bool = True, group: bool = True) -> str:
+    """Join values tagged with a PubMed field, e.g. ("a"[AU] OR "b"[AU])"""
+    mark = '"' if quote else ''
+    query = joiner.join(f'{mark}{value}{mark}[{tag}]' for value in values)
+    return f'({query})' if group else query
+
+
+def _compile_path(path: str):
+    """Compile a child element path once: an lxml XPath, or a findall() fallback"""
+    if HAVE_LXML:
+        return ET.XPath(path)
+    return methodcaller('findall', path)
+
+
+def _substring_pattern(terms: List[str]) -> "re.Pattern":
+    """One case-insensitive regex matching any of the terms as a plain substring"""
+    if not terms:
+        return re.compile(r'(?!)')  # No terms never match, like any() over an empty list
+    return re.compile('|'.join(re.escape(str(term)) for term in terms), re.IGNORECASE)
+
+
+def _article_year(article: Dict[str, Any], default: int) -> int:
+    """An article's year: the 'year' parsed at fetch time, else the first publication_date token
+    
+    Raises ValueError/IndexError for dates that don't start with a number.
+    """
+    year = article.get('year')
+    if year is None:
+        pub_date = article.get('publication_date', '')
+        year = int(pub_date.split()[0]) if pub_date else default
+    return year
+
+
+def _first(matches: List[Any]) -> Optional[Any]:
+    """First element of a compiled path's matches, or None"""
+    return matches[0] if matches else None
+
+
+def _release_element(elem) -> None:
+    """Free a parsed PubmedArticle (and, under lxml, the already parsed siblings before it)"""
+    elem.clear()
+    if HAVE_LXML:
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+def _article_pull_parser():
+    """Incremental parser reporting the end of each PubmedArticle, for bodies fed in chunks"""
+    if HAVE_LXML:
+        # efetch responses carry a DOCTYPE; never resolve entities or fetch the DTD
+        return ET.XMLPullParser(events=('end',), tag='PubmedArticle',
+                                resolve_entities=False, no_network=True)
+    return ET.XMLPullParser(events=('end',))
+
+
+def _in_request_order(pmids: List[str], articles: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Reorder fetched articles to match the requested PMIDs"""
+    by_pmid = {article.get('pmid'): article for article in articles}
+    return [by_pmid[pmid] for pmid in pmids if pmid in by_pmid]
+
+
+def _parse_epost(content: bytes) -> Tuple[str, str]:
+    """(WebEnv, query_key) from an epost response body"""
+    root = ET.fromstring(content)
+    webenv = root.findtext('WebEnv')
+    query_key = root.findtext('QueryKey')
+    if not webenv or not query_key:
+        raise ValueError(f"EPost did not return a history key: {root.findtext('ERROR')}")
+    return webenv, query_key
+
+
+def _parse_full_text_links(data: Dict[str, Any]) -> Dict[str, str]:
+    """Provider -> URL from an elink prlinks response"""
+    links = {}
+    if 'linksets' in data and data['linksets']:
+        linkset = data['linksets'][0]
+        if 'idurllist' in linkset and linkset['idurllist']:
+            urls = linkset['idurllist'][0].get('objurls', [])
+            for url_info in urls:
+                provider = url_info.get('provider', 'Unknown')
+                url = url_info.get('url', {}).get('value', '')
+                if url:
+                    links[provider] = url
+    return links
+
+
+def _parse_citations(pmid: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Citation summary from an elink pubmed_pubmed_citedin response"""
+    citations = {
+        'pmid': pmid,
+        'cited_by_pmids': [],
+        'citation_count': 0
+    }
+    
+    if 'linksets' in data and data['linksets']:
+        for linkset in data['linksets']:
+            if 'linksetdbs' in linkset:
+                for db in linkset['linksetdbs']:
+                    if db.get('linkname') == 'pubmed_pubmed_citedin':
+                        citations['cited_by_pmids'] = list(db.get('links', []))
+                        citations['citation_count'] = len(citations['cited_by_pmids'])
+                        break
+    
+    return citations
+
+
+def _parse_related(data: Dict[str, Any], max_related: int) -> List[str]:
+    """Related PMIDs from an elink pubmed_pubmed response"""
+    related_pmids = []
+    if 'linksets' in data and data['linksets']:
+        for linkset in data['linksets']:
+            if 'linksetdbs' in linkset:
+                for db in linkset['linksetdbs']:
+                    if db.get('linkname') == 'pubmed_pubmed':
+                        related_pmids = db.get('links', [])[:max_related]
+                        break
+    return related_pmids
+
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Seconds before retrying a 429/5xx: its Retry-After, else REQUEST_RETRY's backoff"""
+    retry_after = response.headers.get('Retry-After', '')
+    if retry_after.isdigit():
+        return float(retry_after)
+    return REQUEST_RETRY.backoff_factor * (2 ** attempt)
+
+
+# (connect, read) timeouts in seconds for E-utilities calls
+REQUEST_TIMEOUT = (5, 30)
+
+# The same timeouts for the async (httpx) client
+ASYNC_REQUEST_TIMEOUT = httpx.Timeout(REQUEST_TIMEOUT[1], connect=REQUEST_TIMEOUT[0])
+
+# efetch batch size; fetches of more PMIDs than this page through the history server
+EFETCH_BATCH_SIZE = 500
+
+# Transient E-utilities failures (429s from bursts, 5xx) get up to four retries inside
+# the adapter: a Retry-After header sets the wait, otherwise exponential backoff.
+# Retries don't take rate limit tokens, so a 429 is never charged twice.
+REQUEST_RETRY = Retry(total=4, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=('GET', 'POST'), respect_retry_after_header=True,
+                      raise_on_status=False)
+
+# Leading four-digit year of a PubDate <Year> or <MedlineDate> (e.g. "1998 Dec-1999 Jan")
+PUBLICATION_YEAR_RE = re.compile(r'\d{4}')
+
+# elink results (citations, related articles, full text links) change slowly; keep
+# up to ELINK_CACHE_SIZE parsed responses for ELINK_CACHE_TTL seconds
+ELINK_CACHE_SIZE = 4096
+ELINK_CACHE_TTL = float(os.environ.get('PUBMED_ELINK_CACHE_TTL', 24 * 3600))
+
+# PMIDs per elink call in get_citations_batch
+CITATION_BATCH_SIZE = 200
+
+# Shared pool for concurrent efetch batches; requests are still spaced by the rate limit
+EFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix='pubmed-efetch')
+
+# Shared pool for per-article elink lookups; requests are still spaced by the client's rate limit
+FULL_TEXT_LINK_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix='pubmed-elink')
+
+# advanced_search field schema: (criteria field, PubMed tag, joiner, wrap in parentheses)
+ADVANCED_SEARCH_FIELDS = (
+    ('keywords', 'All Fields', ' OR ', False),
+    ('title_words', 'TI', ' AND ', False),
+    ('abstract_words', 'AB', ' AND ', False),
+    ('authors', 'AU', ' OR ', True),
+    ('journals', 'TA', ' OR ', True),
+    ('mesh_terms', 'MeSH Major Topic', ' OR ', True),
+)
+
+# Form fields accepted by advanced_search: JSON-encoded lists and plain strings
+ADVANCED_SEARCH_LIST_FIELDS = tuple(field for field, _, _, _ in ADVANCED_SEARCH_FIELDS) + ('publication_types',)
+ADVANCED_SEARCH_SCALAR_FIELDS = ('date_from', 'date_to')
+
+
+def parse_advanced_search_form(form_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Build advanced_search keyword arguments from submitted form data in one pass"""
+    criteria = {field: orjson.loads(form_data[field])
+                for field in ADVANCED_SEARCH_LIST_FIELDS if form_data.get(field)}
+    criteria.update({field: form_data[field]
+                     for field in ADVANCED_SEARCH_SCALAR_FIELDS if form_data.get(field)})
+    return criteria
+
+
 class PubMedClient:
     """Wrapper class for PubMed E-utilities API operations"""
     
+    # Exact PubmedArticle paths from the PubMed DTD, so no lookup walks a whole subtree
+    _XP_PMID = _compile_path('MedlineCitation/PMID')
+    _XP_ARTICLE = _compile_path('MedlineCitation/Article')
+    _XP_MESH = _compile_path('MedlineCitation/MeshHeadingList/MeshHeading/DescriptorName')
+    _XP_KEYWORDS = _compile_path('MedlineCitation/KeywordList/Keyword')
+    _XP_ARTICLE_IDS = _compile_path('PubmedData/ArticleIdList/ArticleId')
+    # Paths below MedlineCitation/Article
+    _XP_TITLE = _compile_path('ArticleTitle')
+    _XP_ABSTRACT = _compile_path('Abstract/AbstractText')
+    _XP_AUTHORS = _compile_path('AuthorList/Author')
+    _XP_AFFILIATION = _compile_path('AffiliationInfo/Affiliation')
+    _XP_JOURNAL = _compile_path('Journal')
+    _XP_JOURNAL_TITLE = _compile_path('Title')
+    _XP_PUB_DATE = _compile_path('JournalIssue/PubDate')
+    _XP_PUB_TYPES = _compile_path('PublicationTypeList/PublicationType')
+    
     def __init__(self):
         """Initialize PubMed client with configuration"""
         self.base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
@@ -25,18 +242,62 @@ class PubMedClient:
         self.email = os.environ.get('PUBMED_EMAIL', 'user@example.com')
         self.tool = os.environ.get('PUBMED_TOOL', 'ResearchPlatform')
         
-        # Rate limiting: 3/sec without key, 10/sec with key
+        # Rate limiting: 3/sec without key, 10/sec with key, as a token bucket
+        # holding up to one second of requests so short bursts go out at once
         self.rate_limit = 10 if self.api_key else 3
-        self.last_request_time = 0
+        self._bucket_tokens = float(self.rate_limit)
+        self._bucket_last = time.monotonic()
+        self._bucket_lock = threading.Lock()
         
         # Default parameters
         self.default_retmax = 100  # Max results per request
         self.max_retmax = 10000    # PubMed's maximum
         
+        # Reuse pooled keep-alive connections for all E-utilities calls; efetch XML
+        # compresses about 10:1, so always ask for gzip (streamed bodies are
+        # decompressed in _iter_article_elements)
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': f"{self.tool} ({self.email})",
+                                     'Accept-Encoding': 'gzip, deflate'})
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=REQUEST_RETRY))
+        
+        # HTTP/2 client for the async methods, created per event loop
+        self._async_client = None
+        self._async_loop = None
+        
+        # Parsed elink responses keyed on their parameters: {key: (data, expires_at)}
+        self._elink_cache = OrderedDict()
+        self._elink_cache_lock = threading.Lock()
+        
+        # Cached connectivity probe result: (connected, checked_at)
+        self.connectivity_ttl = 30.0
+        self._connectivity = None
+        
         logger.info(f"PubMed client initialized (API key: {'Yes' if self.api_key else 'No'})")
     
+    def close(self):
+        """Close the pooled HTTP connections"""
+        self.session.close()
+    
+    async def aclose(self):
+        """Close the async client's pooled HTTP connections (and the sync ones)"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_loop = None
+        self.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
     def is_connected(self) -> bool:
-        """Check if client can connect to PubMed"""
+        """Check if client can connect to PubMed (probe result cached for connectivity_ttl seconds)"""
+        now = time.monotonic()
+        if self._connectivity is not None and now - self._connectivity[1] < self.connectivity_ttl:
+            return self._connectivity[0]
         try:
             # Test with a simple search
             response = self._make_request('esearch.fcgi', {
@@ -44,35 +305,146 @@ class PubMedClient:
                 'term': 'test',
                 'retmax': 1
             })
-            return response.status_code == 200
+            connected = response.status_code == 200
         except:
-            return False
+            connected = False
+        self._connectivity = (connected, now)
+        return connected
     
-    def _make_request(self, endpoint: str, params: Dict[str, Any]) -> requests.Response:
-        """Make rate-limited request to PubMed API"""
-        # Add authentication parameters
-        params['email'] = self.email
-        params['tool'] = self.tool
-        if self.api_key:
-            params['api_key'] = self.api_key
+    def invalidate_connectivity(self):
+        """Drop the cached connectivity result so the next check probes PubMed"""
+        self._connectivity = None
+    
+    def _make_request(self, endpoint: str, params: Dict[str, Any],
+                      stream: bool = False, post: bool = False) -> requests.Response:
+        """Make rate-limited request to PubMed API
         
-        # Rate limiting
-        time_since_last = time.time() - self.last_request_time
-        min_interval = 1.0 / self.rate_limit
-        if time_since_last < min_interval:
-            time.sleep(min_interval - time_since_last)
+        stream=True leaves the body unread; post=True sends the parameters as a
+        form body, for ID lists too long for a URL.
+        """
+        self._add_auth_params(params)
+        
+        wait = self._take_rate_token()
+        if wait > 0:
+            time.sleep(wait)
         
         # Make request
         url = f"{self.base_url}/{endpoint}"
-        response = requests.get(url, params=params)
-        self.last_request_time = time.time()
+        if post:
+            response = self.session.post(url, data=params, timeout=REQUEST_TIMEOUT, stream=stream)
+        else:
+            response = self.session.get(url, params=params, timeout=REQUEST_TIMEOUT, stream=stream)
+        
+        if response.status_code != 200:
+            logger.error(f"PubMed API error: {response.status_code} - {response.text}")
+            response.raise_for_status()
+        
+        return response
+    
+    async def _amake_request(self, endpoint: str, params: Dict[str, Any],
+                             stream: bool = False, post: bool = False) -> httpx.Response:
+        """Async version of _make_request
+        
+        429/5xx responses are retried here as REQUEST_RETRY does for the sync
+        session. With stream=True the caller must aclose() the response.
+        """
+        self._add_auth_params(params)
+        
+        wait = self._take_rate_token()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        
+        client = self._get_async_client()
+        url = f"{self.base_url}/{endpoint}"
+        for attempt in range(REQUEST_RETRY.total + 1):
+            if post:
+                request = client.build_request('POST', url, data=params)
+            else:
+                request = client.build_request('GET', url, params=params)
+            response = await client.send(request, stream=stream)
+            if response.status_code not in REQUEST_RETRY.status_forcelist or attempt == REQUEST_RETRY.total:
+                break
+            await response.aclose()
+            await asyncio.sleep(_retry_delay(response, attempt))
         
         if response.status_code != 200:
+            await response.aread()
             logger.error(f"PubMed API error: {response.status_code} - {response.text}")
             response.raise_for_status()
         
         return response
     
+    def _add_auth_params(self, params: Dict[str, Any]) -> None:
+        """Add the E-utilities identification (and API key) parameters"""
+        params['email'] = self.email
+        params['tool'] = self.tool
+        if self.api_key:
+            params['api_key'] = self.api_key
+    
+    def _take_rate_token(self) -> float:
+        """Take a rate limit token, returning how long to wait before sending
+        
+        The bucket is shared by all threads and coroutines; an empty bucket
+        goes into debt so each caller sleeps (outside the lock) until its token refills.
+        """
+        with self._bucket_lock:
+            now = time.monotonic()
+            self._bucket_tokens = min(self.rate_limit,
+                                      self._bucket_tokens + (now - self._bucket_last) * self.rate_limit)
+            self._bucket_last = now
+            self._bucket_tokens -= 1
+            return -self._bucket_tokens / self.rate_limit
+    
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """HTTP/2 client for the running event loop
+        
+        Its connection pool belongs to the loop that first used it, so a new
+        client is made when called from a different loop (e.g. successive
+        asyncio.run() calls).
+        """
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(
+                http2=True, headers=dict(self.session.headers), timeout=ASYNC_REQUEST_TIMEOUT,
+                limits=httpx.Limits(max_connections=self.rate_limit, max_keepalive_connections=self.rate_limit))
+            self._async_loop = loop
+        return self._async_client
+    
+    def _elink(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Run an elink query (retmode=json), reusing a cached result while it is fresh"""
+        key = tuple(sorted(params.items()))
+        data = self._cached_elink(key)
+        if data is None:
+            data = orjson.loads(self._make_request('elink.fcgi', dict(params)).content)
+            self._store_elink(key, data)
+        return data
+    
+    async def _aelink(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Async version of _elink() (shares its cache)"""
+        key = tuple(sorted(params.items()))
+        data = self._cached_elink(key)
+        if data is None:
+            data = orjson.loads((await self._amake_request('elink.fcgi', dict(params))).content)
+            self._store_elink(key, data)
+        return data
+    
+    def _cached_elink(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """A fresh cached elink response, or None"""
+        with self._elink_cache_lock:
+            cached = self._elink_cache.get(key)
+            if cached is not None and cached[1] > time.monotonic():
+                self._elink_cache.move_to_end(key)
+                return cached[0]
+        return None
+    
+    def _store_elink(self, key: Tuple, data: Dict[str, Any]) -> None:
+        """Cache an elink response for ELINK_CACHE_TTL seconds"""
+        with self._elink_cache_lock:
+            self._elink_cache[key] = (data, time.monotonic() + ELINK_CACHE_TTL)
+            self._elink_cache.move_to_end(key)
+            while len(self._elink_cache) > ELINK_CACHE_SIZE:
+                self._elink_cache.popitem(last=False)
+    
     def search(self, query: str, filters: Optional[Dict[str, Any]] = None,
               max_results: int = 100) -> Dict[str, Any]:
         """
@@ -101,7 +473,7 @@ class PubMedClient:
             }
             
             response = self._make_request('esearch.fcgi', search_params)
-            search_data = response.json()
+            search_data = orjson.loads(response.content)
             
             # Extract results
             result = {
@@ -137,36 +509,31 @@ class PubMedClient:
         if 'publication_types' in filters:
             pub_types = filters['publication_types']
             if isinstance(pub_types, list):
-                pub_type_query = ' OR '.join([f'{pt}[PT]' for pt in pub_types])
-                query_parts.append(f'({pub_type_query})')
+                query_parts.append(_field_query(pub_types, 'PT', quote=False))
         
         # Language filter
         if 'languages' in filters:
             languages = filters['languages']
             if isinstance(languages, list):
-                lang_query = ' OR '.join([f'{lang}[LA]' for lang in languages])
-                query_parts.append(f'({lang_query})')
+                query_parts.append(_field_query(languages, 'LA', quote=False))
         
         # Journal filter
         if 'journals' in filters:
             journals = filters['journals']
             if isinstance(journals, list):
-                journal_query = ' OR '.join([f'"{j}"[TA]' for j in journals])
-                query_parts.append(f'({journal_query})')
+                query_parts.append(_field_query(journals, 'TA'))
         
         # MeSH terms
         if 'mesh_terms' in filters:
             mesh_terms = filters['mesh_terms']
             if isinstance(mesh_terms, list):
-                mesh_query = ' OR '.join([f'"{term}"[MeSH]' for term in mesh_terms])
-                query_parts.append(f'({mesh_query})')
+                query_parts.append(_field_query(mesh_terms, 'MeSH'))
         
         # Author filter
         if 'authors' in filters:
             authors = filters['authors']
             if isinstance(authors, list):
-                author_query = ' OR '.join([f'"{author}"[AU]' for author in authors])
-                query_parts.append(f'({author_query})')
+                query_parts.append(_field_query(authors, 'AU'))
         
         # Free text fields
         if 'title_abstract' in filters and filters['title_abstract']:
@@ -192,35 +559,63 @@ class PubMedClient:
         if not pmids:
             return []
         
-        articles = []
+        try:
+            # A single batch posts its IDs to efetch directly; larger fetches upload
+            # the IDs to the history server once and page through them by retstart
+            if len(pmids) <= EFETCH_BATCH_SIZE:
+                batches = [{'id': ','.join(pmids)}]
+            else:
+                batches = self._history_batches(pmids, *self._epost(pmids))
+            
+            # Batches overlap within the rate limit
+            articles = []
+            for batch_articles in EFETCH_EXECUTOR.map(
+                    lambda batch: self._fetch_batch(batch, include_abstract, include_full_text), batches):
+                articles.extend(batch_articles)
+            
+            if len(batches) > 1:
+                # Return articles in the order the PMIDs were requested
+                articles = _in_request_order(pmids, articles)
+            
+            logger.info(f"Successfully fetched {len(articles)} articles")
+            return articles
+            
+        except Exception as e:
+            logger.error(f"Error fetching articles: {e}")
+            raise
+    
+    async def afetch_articles(self, pmids: List[str],
+                              include_abstract: bool = True,
+                              include_full_text: bool = False) -> List[Dict[str, Any]]:
+        """
+        Async version of fetch_articles
+        
+        Batches (and their full text link lookups) run concurrently over one
+        HTTP/2 connection, at most rate_limit batches at a time and within the
+        shared rate limit.
+        """
+        if not pmids:
+            return []
         
         try:
-            # Process in batches of 200 (PubMed limit)
-            batch_size = 200
-            for i in range(0, len(pmids), batch_size):
-                batch_pmids = pmids[i:i + batch_size]
-                logger.info(f"Fetching batch {i//batch_size + 1}: {len(batch_pmids)} articles")
-                
-                # Fetch article data
-                fetch_params = {
-                    'db': 'pubmed',
-                    'id': ','.join(batch_pmids),
-                    'retmode': 'xml'
-                }
-                
-                response = self._make_request('efetch.fcgi', fetch_params)
-                
-                # Parse XML response
-                root = ET.fromstring(response.text)
-                
-                for article_elem in root.findall('.//PubmedArticle'):
-                    article = self._parse_article_xml(article_elem, include_abstract)
-                    
-                    # Add full text links if requested
-                    if include_full_text:
-                        article['full_text_links'] = self._get_full_text_links(article['pmid'])
-                    
-                    articles.append(article)
+            if len(pmids) <= EFETCH_BATCH_SIZE:
+                batches = [{'id': ','.join(pmids)}]
+            else:
+                batches = self._history_batches(pmids, *(await self._aepost(pmids)))
+            
+            # Created here so it belongs to the running event loop
+            semaphore = asyncio.Semaphore(self.rate_limit)
+            
+            async def fetch(batch):
+                async with semaphore:
+                    return await self._afetch_batch(batch, include_abstract, include_full_text)
+            
+            articles = []
+            for batch_articles in await asyncio.gather(*(fetch(batch) for batch in batches)):
+                articles.extend(batch_articles)
+            
+            if len(batches) > 1:
+                articles = _in_request_order(pmids, articles)
             
             logger.info(f"Successfully fetched {len(articles)} articles")
             return articles
@@ -229,6 +624,105 @@ class PubMedClient:
             logger.error(f"Error fetching articles: {e}")
             raise
     
+    def _history_batches(self, pmids: List[str], webenv: str, query_key: str) -> List[Dict[str, Any]]:
+        """efetch parameters paging through PMIDs uploaded with epost"""
+        return [{'WebEnv': webenv, 'query_key': query_key, 'retstart': start, 'retmax': EFETCH_BATCH_SIZE}
+                for start in range(0, len(pmids), EFETCH_BATCH_SIZE)]
+    
+    def _epost(self, pmids: List[str]) -> Tuple[str, str]:
+        """Upload PMIDs to the E-utilities history server, returning (WebEnv, query_key)"""
+        response = self._make_request('epost.fcgi', {'db': 'pubmed', 'id': ','.join(pmids)}, post=True)
+        return _parse_epost(response.content)
+    
+    async def _aepost(self, pmids: List[str]) -> Tuple[str, str]:
+        """Async version of _epost()"""
+        response = await self._amake_request('epost.fcgi', {'db': 'pubmed', 'id': ','.join(pmids)}, post=True)
+        return _parse_epost(response.content)
+    
+    def _fetch_batch(self, batch_params: Dict[str, Any], include_abstract: bool,
+                     include_full_text: bool) -> List[Dict[str, Any]]:
+        """Fetch and parse one efetch batch (an id list, or a history server page)"""
+        logger.info(f"Fetching articles from offset {batch_params.get('retstart', 0)}")
+        
+        # Fetch article data
+        fetch_params = {
+            'db': 'pubmed',
+            'retmode': 'xml',
+            **batch_params
+        }
+        
+        # Parse articles as they arrive instead of building the whole batch's tree
+        with self._make_request('efetch.fcgi', fetch_params, stream=True, post=True) as response:
+            batch_articles = [self._parse_article_xml(article_elem, include_abstract)
+                              for article_elem in self._iter_article_elements(response)]
+        
+        # Add full text links if requested (lookups overlap, still within the rate limit)
+        if include_full_text:
+            links = FULL_TEXT_LINK_EXECUTOR.map(
+                self._get_full_text_links, [article['pmid'] for article in batch_articles])
+            for article, article_links in zip(batch_articles, links):
+                article['full_text_links'] = article_links
+        
+        return batch_articles
+    
+    async def _afetch_batch(self, batch_params: Dict[str, Any], include_abstract: bool,
+                            include_full_text: bool) -> List[Dict[str, Any]]:
+        """Async version of _fetch_batch(), parsing the body as its chunks arrive"""
+        logger.info(f"Fetching articles from offset {batch_params.get('retstart', 0)}")
+        
+        fetch_params = {
+            'db': 'pubmed',
+            'retmode': 'xml',
+            **batch_params
+        }
+        
+        batch_articles = []
+        parser = _article_pull_parser()
+        response = await self._amake_request('efetch.fcgi', fetch_params, stream=True, post=True)
+        try:
+            async for chunk in response.aiter_bytes():
+                parser.feed(chunk)
+                batch_articles.extend(self._parse_article_events(parser, include_abstract))
+            parser.close()
+            batch_articles.extend(self._parse_article_events(parser, include_abstract))
+        finally:
+            await response.aclose()
+        
+        if include_full_text:
+            links = await asyncio.gather(*(self._aget_full_text_links(article['pmid'])
+                                           for article in batch_articles))
+            for article, article_links in zip(batch_articles, links):
+                article['full_text_links'] = article_links
+        
+        return batch_articles
+    
+    def _parse_article_events(self, parser, include_abstract: bool) -> List[Dict[str, Any]]:
+        """Parse the PubmedArticles a pull parser has completed so far"""
+        articles = []
+        for _, elem in parser.read_events():
+            if elem.tag == 'PubmedArticle':
+                articles.append(self._parse_article_xml(elem, include_abstract))
+                _release_element(elem)
+        return articles
+    
+    def _iter_article_elements(self, response: requests.Response):
+        """Yield each PubmedArticle of a streamed efetch response, freeing it once parsed"""
+        # Let urllib3 undo gzip so the parser sees the XML itself
+        response.raw.decode_content = True
+        if HAVE_LXML:
+            # efetch responses carry a DOCTYPE; never resolve entities or fetch the DTD
+            context = ET.iterparse(response.raw, events=('end',), tag='PubmedArticle',
+                                   resolve_entities=False, no_network=True)
+        else:
+            context = ET.iterparse(response.raw, events=('end',))
+        
+        for _, elem in context:
+            if elem.tag != 'PubmedArticle':
+                continue
+            yield elem
+            # Free it (and parsed siblings) so memory stays flat across the batch
+            _release_element(elem)
+    
     def _parse_article_xml(self, article_elem: ET.Element, 
                           include_abstract: bool = True) -> Dict[str, Any]:
         """Parse article XML element into dictionary"""
@@ -236,20 +730,20 @@ class PubMedClient:
         
         try:
             # PMID
-            pmid_elem = article_elem.find('.//PMID')
+            pmid_elem = _first(self._XP_PMID(article_elem))
             article['pmid'] = pmid_elem.text if pmid_elem is not None else ''
             
             # Article metadata
-            article_meta = article_elem.find('.//Article')
-            if article_meta:
+            article_meta = _first(self._XP_ARTICLE(article_elem))
+            if article_meta is not None:
                 # Title
-                title_elem = article_meta.find('.//ArticleTitle')
+                title_elem = _first(self._XP_TITLE(article_meta))
                 article['title'] = title_elem.text if title_elem is not None else ''
                 
                 # Abstract
                 if include_abstract:
                     abstract_texts = []
-                    for abstract_elem in article_meta.findall('.//AbstractText'):
+                    for abstract_elem in self._XP_ABSTRACT(article_meta):
                         label = abstract_elem.get('Label', '')
                         text = abstract_elem.text or ''
                         if label:
@@ -262,7 +756,7 @@ class PubMedClient:
                 authors = []
                 author_affiliations = []
                 
-                for author in article_meta.findall('.//Author'):
+                for author in self._XP_AUTHORS(article_meta):
                     author_data = {}
                     
                     # Get name
@@ -275,7 +769,7 @@ class PubMedClient:
                         author_data['name'] = name
                         
                         # Get affiliation for this author
-                        affiliation_elem = author.find('.//Affiliation')
+                        affiliation_elem = _first(self._XP_AFFILIATION(author))
                         if affiliation_elem is not None and affiliation_elem.text:
                             author_data['affiliation'] = affiliation_elem.text
                             author_affiliations.append(affiliation_elem.text)
@@ -286,14 +780,14 @@ class PubMedClient:
                 article['affiliations'] = list(set(author_affiliations))  # Unique affiliations list
                 
                 # Journal info
-                journal = article_meta.find('.//Journal')
-                if journal:
-                    title_elem = journal.find('.//Title')
+                journal = _first(self._XP_JOURNAL(article_meta))
+                if journal is not None:
+                    title_elem = _first(self._XP_JOURNAL_TITLE(journal))
                     article['journal'] = title_elem.text if title_elem is not None else ''
                     
                     # Publication date
-                    pub_date = journal.find('.//PubDate')
-                    if pub_date:
+                    pub_date = _first(self._XP_PUB_DATE(journal))
+                    if pub_date is not None:
                         year = pub_date.find('Year')
                         month = pub_date.find('Month')
                         day = pub_date.find('Day')
@@ -306,30 +800,36 @@ class PubMedClient:
                         if day is not None:
                             date_parts.append(day.text)
                         article['publication_date'] = ' '.join(date_parts)
+                        
+                        # Numeric year for filtering and BibTeX, parsed once here
+                        year_text = year.text if year is not None else pub_date.findtext('MedlineDate')
+                        year_match = PUBLICATION_YEAR_RE.match(year_text or '')
+                        if year_match:
+                            article['year'] = int(year_match.group())
                 
                 # Publication type
                 pub_types = []
-                for pub_type in article_meta.findall('.//PublicationType'):
+                for pub_type in self._XP_PUB_TYPES(article_meta):
                     if pub_type.text:
                         pub_types.append(pub_type.text)
                 article['publication_types'] = pub_types
                 
                 # MeSH terms
                 mesh_terms = []
-                for mesh in article_elem.findall('.//MeshHeading/DescriptorName'):
+                for mesh in self._XP_MESH(article_elem):
                     if mesh.text:
                         mesh_terms.append(mesh.text)
                 article['mesh_terms'] = mesh_terms
                 
                 # Keywords
                 keywords = []
-                for keyword in article_meta.findall('.//Keyword'):
+                for keyword in self._XP_KEYWORDS(article_elem):
                     if keyword.text:
                         keywords.append(keyword.text)
                 article['keywords'] = keywords
                 
                 # DOI
-                for article_id in article_elem.findall('.//ArticleId'):
+                for article_id in self._XP_ARTICLE_IDS(article_elem):
                     if article_id.get('IdType') == 'doi':
                         article['doi'] = article_id.text
                         break
@@ -352,56 +852,86 @@ class PubMedClient:
                 'retmode': 'json'
             }
             
-            response = self._make_request('elink.fcgi', params)
-            data = response.json()
-            
-            # Parse link data
-            if 'linksets' in data and data['linksets']:
-                linkset = data['linksets'][0]
-                if 'idurllist' in linkset and linkset['idurllist']:
-                    urls = linkset['idurllist'][0].get('objurls', [])
-                    for url_info in urls:
-                        provider = url_info.get('provider', 'Unknown')
-                        url = url_info.get('url', {}).get('value', '')
-                        if url:
-                            links[provider] = url
+            links = _parse_full_text_links(self._elink(params))
         
         except Exception as e:
             logger.warning(f"Could not fetch full text links for PMID {pmid}: {e}")
         
         return links
     
+    async def _aget_full_text_links(self, pmid: str) -> Dict[str, str]:
+        """Async version of _get_full_text_links()"""
+        try:
+            return _parse_full_text_links(await self._aelink(
+                {'db': 'pubmed', 'id': pmid, 'cmd': 'prlinks', 'retmode': 'json'}))
+        except Exception as e:
+            logger.warning(f"Could not fetch full text links for PMID {pmid}: {e}")
+            return {}
+    
     def get_citations(self, pmid: str) -> Dict[str, Any]:
         """Get citation information for an article"""
         try:
-            # Get citing articles
-            params = {
-                'db': 'pubmed',
-                'id': pmid,
-                'linkname': 'pubmed_pubmed_citedin',
-                'retmode': 'json'
-            }
+            return self.get_citations_batch([pmid])[pmid]
             
-            response = self._make_request('elink.fcgi', params)
-            data = response.json()
+        except Exception as e:
+            logger.error(f"Error fetching citations for PMID {pmid}: {e}")
+            raise
+    
+    def get_citations_batch(self, pmids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get citation information for many articles, up to CITATION_BATCH_SIZE per elink call
+        
+        Args:
+            pmids: List of PubMed IDs
             
-            citations = {
-                'pmid': pmid,
-                'cited_by_pmids': [],
-                'citation_count': 0
-            }
+        Returns:
+            Dictionary of PMID -> citation information (as returned by get_citations)
+        """
+        try:
+            citations = {}
+            missing = []
+            for pmid in dict.fromkeys(pmids):
+                data = self._cached_elink(self._citations_key(pmid))
+                if data is None:
+                    missing.append(pmid)
+                else:
+                    citations[pmid] = _parse_citations(pmid, data)
             
-            if 'linksets' in data and data['linksets']:
-                for linkset in data['linksets']:
-                    if 'linksetdbs' in linkset:
-                        for db in linkset['linksetdbs']:
-                            if db.get('linkname') == 'pubmed_pubmed_citedin':
-                                citations['cited_by_pmids'] = db.get('links', [])
-                                citations['citation_count'] = len(citations['cited_by_pmids'])
-                                break
+            for i in range(0, len(missing), CITATION_BATCH_SIZE):
+                batch_pmids = missing[i:i + CITATION_BATCH_SIZE]
+                # Repeated id= parameters get one linkset per PMID (a comma-joined id would merge them)
+                params = {
+                    'db': 'pubmed',
+                    'id': batch_pmids,
+                    'linkname': 'pubmed_pubmed_citedin',
+                    'retmode': 'json'
+                }
+                data = orjson.loads(self._make_request('elink.fcgi', params, post=True).content)
+                linksets = {str(linkset['ids'][0]): linkset
+                            for linkset in data.get('linksets', []) if linkset.get('ids')}
+                
+                # Cache each PMID's linkset as its own single-PMID elink response
+                for pmid in batch_pmids:
+                    pmid_data = {'linksets': [linksets[pmid]] if pmid in linksets else []}
+                    self._store_elink(self._citations_key(pmid), pmid_data)
+                    citations[pmid] = _parse_citations(pmid, pmid_data)
             
             return citations
             
+        except Exception as e:
+            logger.error(f"Error fetching citations for {len(pmids)} PMIDs: {e}")
+            raise
+    
+    def _citations_key(self, pmid: str) -> Tuple:
+        """elink cache key of a single-PMID citation lookup (shared with aget_citations)"""
+        return tuple(sorted({'db': 'pubmed', 'id': pmid, 'linkname': 'pubmed_pubmed_citedin',
+                             'retmode': 'json'}.items()))
+    
+    async def aget_citations(self, pmid: str) -> Dict[str, Any]:
+        """Async version of get_citations"""
+        try:
+            return _parse_citations(pmid, await self._aelink(
+                {'db': 'pubmed', 'id': pmid, 'linkname': 'pubmed_pubmed_citedin', 'retmode': 'json'}))
         except Exception as e:
             logger.error(f"Error fetching citations for PMID {pmid}: {e}")
             raise
@@ -417,24 +947,22 @@ class PubMedClient:
                 'retmax': max_related
             }
             
-            response = self._make_request('elink.fcgi', params)
-            data = response.json()
-            
-            related_pmids = []
-            if 'linksets' in data and data['linksets']:
-                for linkset in data['linksets']:
-                    if 'linksetdbs' in linkset:
-                        for db in linkset['linksetdbs']:
-                            if db.get('linkname') == 'pubmed_pubmed':
-                                related_pmids = db.get('links', [])[:max_related]
-                                break
-            
-            return related_pmids
+            return _parse_related(self._elink(params), max_related)
             
         except Exception as e:
             logger.error(f"Error fetching related articles for PMID {pmid}: {e}")
             raise
     
+    async def aget_related_articles(self, pmid: str, max_related: int = 10) -> List[str]:
+        """Async version of get_related_articles"""
+        try:
+            return _parse_related(await self._aelink(
+                {'db': 'pubmed', 'id': pmid, 'linkname': 'pubmed_pubmed', 'retmode': 'json',
+                 'retmax': max_related}), max_related)
+        except Exception as e:
+            logger.error(f"Error fetching related articles for PMID {pmid}: {e}")
+            raise
+    
     def advanced_search(self, 
                        keywords: Optional[List[str]] = None,
                        title_words: Optional[List[str]] = None,
@@ -455,29 +983,18 @@ class PubMedClient:
         Returns:
             Search results dictionary
         """
+        criteria = {
+            'keywords': keywords, 'title_words': title_words,
+            'abstract_words': abstract_words, 'authors': authors,
+            'journals': journals, 'mesh_terms': mesh_terms
+        }
         query_parts = []
         
         # Build query from components
-        if keywords:
-            query_parts.append(' OR '.join([f'"{kw}"[All Fields]' for kw in keywords]))
-        
-        if title_words:
-            query_parts.append(' AND '.join([f'"{word}"[TI]' for word in title_words]))
-        
-        if abstract_words:
-            query_parts.append(' AND '.join([f'"{word}"[AB]' for word in abstract_words]))
-        
-        if authors:
-            author_query = ' OR '.join([f'"{author}"[AU]' for author in authors])
-            query_parts.append(f'({author_query})')
-        
-        if journals:
-            journal_query = ' OR '.join([f'"{journal}"[TA]' for journal in journals])
-            query_parts.append(f'({journal_query})')
-        
-        if mesh_terms:
-            mesh_query = ' OR '.join([f'"{term}"[MeSH Major Topic]' for term in mesh_terms])
-            query_parts.append(f'({mesh_query})')
+        for field, tag, joiner, group in ADVANCED_SEARCH_FIELDS:
+            values = criteria[field]
+            if values:
+                query_parts.append(_field_query(values, tag, joiner, group=group))
         
         # Date range
         if date_from or date_to:
@@ -487,8 +1004,7 @@ class PubMedClient:
         
         # Publication types
         if publication_types:
-            pub_query = ' OR '.join([f'"{pt}"[PT]' for pt in publication_types])
-            query_parts.append(f'({pub_query})')
+            query_parts.append(_field_query(publication_types, 'PT'))
         
         # Combine query parts
         full_query = ' AND '.join(query_parts) if query_parts else '*'
@@ -508,6 +1024,14 @@ class PubMedClient:
         Returns:
             Filtered list of articles
         """
+        # Compile each substring criterion once, so every article is scanned in C
+        keyword_re = _substring_pattern(criteria['keywords']) if 'keywords' in criteria else None
+        author_re = _substring_pattern(criteria['authors']) if 'authors' in criteria else None
+        journal_re = _substring_pattern(criteria['journals']) if 'journals' in criteria else None
+        affiliation_re = _substring_pattern(criteria['affiliations']) if 'affiliations' in criteria else None
+        pub_types = ({pt.lower() for pt in criteria['publication_types']}
+                     if 'publication_types' in criteria else None)
+        
         filtered = []
         
         for article in articles:
@@ -515,69 +1039,48 @@ class PubMedClient:
             include = True
             
             # Keyword filter in title/abstract
-            if 'keywords' in criteria:
-                keywords = criteria['keywords']
-                text = f"{article.get('title', '')} {article.get('abstract', '')}".lower()
-                if not any(kw.lower() in text for kw in keywords):
+            if keyword_re is not None:
+                if not keyword_re.search(f"{article.get('title', '')} {article.get('abstract', '')}"):
                     include = False
             
             # Author filter
-            if include and 'authors' in criteria:
-                article_authors = []
-                for author in article.get('authors', []):
-                    if isinstance(author, dict):
-                        article_authors.append(author.get('name', '').lower())
-                    else:
-                        article_authors.append(str(author).lower())
-                
-                if not any(auth.lower() in ' '.join(article_authors) 
-                          for auth in criteria['authors']):
+            if include and author_re is not None:
+                article_authors = ' '.join(author.get('name', '') if isinstance(author, dict) else str(author)
+                                           for author in article.get('authors', []))
+                if not author_re.search(article_authors):
                     include = False
             
             # Journal filter
-            if include and 'journals' in criteria:
-                article_journal = article.get('journal', '').lower()
-                if not any(j.lower() in article_journal for j in criteria['journals']):
+            if include and journal_re is not None:
+                if not journal_re.search(article.get('journal', '')):
                     include = False
             
             # Publication type filter
-            if include and 'publication_types' in criteria:
-                article_types = [pt.lower() for pt in article.get('publication_types', [])]
-                if not any(pt.lower() in article_types for pt in criteria['publication_types']):
+            if include and pub_types is not None:
+                if not any(pt.lower() in pub_types for pt in article.get('publication_types', [])):
                     include = False
             
             # Year filter
             if include and 'year_from' in criteria:
-                pub_date = article.get('publication_date', '')
                 try:
-                    year = int(pub_date.split()[0]) if pub_date else 0
-                    if year < criteria['year_from']:
+                    if _article_year(article, 0) < criteria['year_from']:
                         include = False
                 except:
                     pass
             
             if include and 'year_to' in criteria:
-                pub_date = article.get('publication_date', '')
                 try:
-                    year = int(pub_date.split()[0]) if pub_date else 9999
-                    if year > criteria['year_to']:
+                    if _article_year(article, 9999) > criteria['year_to']:
                         include = False
                 except:
                     pass
             
-            # Affiliation filter
-            if include and 'affiliations' in criteria:
-                article_affiliations = []
-                for author in article.get('authors', []):
-                    if isinstance(author, dict) and 'affiliation' in author:
-                        article_affiliations.append(author['affiliation'].lower())
-                
-                # Also check the affiliations list
-                for aff in article.get('affiliations', []):
-                    article_affiliations.append(aff.lower())
-                
-                if not any(aff_pattern.lower() in ' '.join(article_affiliations) 
-                          for aff_pattern in criteria['affiliations']):
+            # Affiliation filter (author affiliations and the affiliations list)
+            if include and affiliation_re is not None:
+                article_affiliations = [author['affiliation'] for author in article.get('authors', [])
+                                        if isinstance(author, dict) and 'affiliation' in author]
+                article_affiliations.extend(article.get('affiliations', []))
+                if not affiliation_re.search(' '.join(article_affiliations)):
                     include = False
             
             if include:
@@ -586,6 +1089,77 @@ class PubMedClient:
         logger.info(f"Filtered {len(articles)} articles to {len(filtered)} based on local criteria")
         return filtered
     
+    def filter_articles_fast(self, articles: List[Dict[str, Any]],
+                             criteria: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Vectorized filter_articles_local for large article lists
+        
+        Takes the same criteria and returns the same articles, but matches each
+        criterion across a pandas column at once. Falls back to
+        filter_articles_local when pandas is not installed.
+        
+        Args:
+            articles: List of article dictionaries
+            criteria: Filtering criteria
+            
+        Returns:
+            Filtered list of articles
+        """
+        try:
+            import pandas as pd
+        except ImportError:
+            return self.filter_articles_local(articles, criteria)
+        
+        if not articles:
+            return []
+        
+        def author_names(article):
+            return ' '.join(author.get('name', '') if isinstance(author, dict) else str(author)
+                            for author in article.get('authors', []))
+        
+        def all_affiliations(article):
+            affiliations = [author['affiliation'] for author in article.get('authors', [])
+                            if isinstance(author, dict) and 'affiliation' in author]
+            affiliations.extend(article.get('affiliations', []))
+            return ' '.join(affiliations)
+        
+        # Substring criteria: (criteria field, column builder)
+        text_columns = (
+            ('keywords', lambda article: f"{article.get('title', '')} {article.get('abstract', '')}"),
+            ('authors', author_names),
+            ('journals', lambda article: article.get('journal', '')),
+            ('affiliations', all_affiliations),
+        )
+        
+        mask = pd.Series(True, index=range(len(articles)))
+        for field, column in text_columns:
+            if field in criteria:
+                values = pd.Series([column(article) for article in articles])
+                mask &= values.str.contains(_substring_pattern(criteria[field]).pattern,
+                                            flags=re.IGNORECASE, regex=True)
+        
+        if 'publication_types' in criteria:
+            pub_types = {pt.lower() for pt in criteria['publication_types']}
+            mask &= pd.Series([any(pt.lower() in pub_types for pt in article.get('publication_types', []))
+                               for article in articles])
+        
+        # Year filters: the parsed 'year' if present, else the leading publication_date token;
+        # an empty date counts as year 0 / 9999, a non-numeric one always passes
+        if 'year_from' in criteria or 'year_to' in criteria:
+            known = pd.Series([article.get('year') for article in articles], dtype='float64')
+            dates = pd.Series([article.get('publication_date', '') or '' for article in articles])
+            years = known.fillna(pd.to_numeric(dates.str.extract(r'^\s*([+-]?\d+)(?:\s|$)', expand=False),
+                                               errors='coerce'))
+            empty = known.isna() & (dates == '')
+            if 'year_from' in criteria:
+                mask &= ~((empty & (0 < criteria['year_from'])) | (years < criteria['year_from']))
+            if 'year_to' in criteria:
+                mask &= ~((empty & (9999 > criteria['year_to'])) | (years > criteria['year_to']))
+        
+        filtered = [article for article, keep in zip(articles, mask.tolist()) if keep]
+        logger.info(f"Filtered {len(articles)} articles to {len(filtered)} based on local criteria")
+        return filtered
+    
     def save_articles(self, articles: List[Dict[str, Any]], 
                      filepath: str, format: str = 'json') -> None:
         """
@@ -598,8 +1172,9 @@ class PubMedClient:
         """
         try:
             if format == 'json':
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(articles, f, indent=2, ensure_ascii=False)
+                # orjson writes UTF-8 bytes directly (same layout as json.dump with indent=2)
+                with open(filepath, 'wb') as f:
+                    f.write(orjson.dumps(articles, option=orjson.OPT_INDENT_2))
             
             elif format == 'csv':
                 import csv
@@ -672,12 +1247,12 @@ class PubMedClient:
         if article.get('journal'):
             bibtex += f"  journal = {{{article['journal']}}},\n"
         
-        if article.get('publication_date'):
-            # Try to extract year
-            pub_date = article['publication_date']
-            year = pub_date.split()[0] if pub_date else ''
-            if year:
-                bibtex += f"  year = {{{year}}},\n"
+        # Year parsed at fetch time, else try to extract it from the date
+        year = article.get('year')
+        if year is None and article.get('publication_date'):
+            year = article['publication_date'].split()[0]
+        if year:
+            bibtex += f"  year = {{{year}}},\n"
         
         if article.get('doi'):
             bibtex += f"  doi = {{{article['doi']}}},\n"
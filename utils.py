@@ -3,18 +3,185 @@ Utility functions and helpers
 """
 
 import os
+import re
+import time
 import uuid
 import logging
+import orjson
+from functools import lru_cache
+from types import MappingProxyType
 from flask import session
 
 logger = logging.getLogger(__name__)
 
+# Matches the optional <script id="server_dirs_config"> block in page templates (read as bytes)
+SERVER_DIRS_CONFIG_RE = re.compile(rb'<script[^>]*id="server_dirs_config"[^>]*>(.*?)</script>', re.DOTALL)
+
+# Characters removed from data file and directory names to prevent directory traversal
+DATA_FILENAME_UNSAFE_RE = re.compile(r'[^a-zA-Z0-9_\-\.]')
+DIRECTORY_NAME_UNSAFE_RE = re.compile(r'[^a-zA-Z0-9_\-]')
+
+# Server file types that can be processed, with their display names
+SERVER_FILE_TYPES = {
+    '.docx': 'Word Document',
+    '.pdf': 'PDF Document',
+    '.txt': 'Text File'
+}
+SUPPORTED_EXTENSIONS = frozenset(SERVER_FILE_TYPES)
+
+# Names of the templates the Jinja loader can see, refreshed on misses
+_template_index = {'names': frozenset(), 'refreshed_at': 0.0}
+
+# Directories seen to exist, mapped to the monotonic time the entry expires
+_directory_exists_cache = {}
+
+# Last formatted UTC timestamp as (second, text); replaced as one tuple so threads never see a mismatch
+_utc_timestamp_cache = {'last': (0, '')}
+
+def utc_timestamp():
+    """Current UTC time as an ISO 8601 string (second resolution), formatted at most once a second"""
+    now = int(time.time())
+    last = _utc_timestamp_cache['last']
+    if last[0] != now:
+        last = (now, time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now)))
+        _utc_timestamp_cache['last'] = last
+    return last[1]
+
+def directory_exists(path, ttl=5.0):
+    """Check whether a directory exists, remembering hits for ttl seconds
+    
+    Only positive results are cached: the app never removes directories, but
+    another worker may create one at any moment.
+    """
+    now = time.monotonic()
+    if _directory_exists_cache.get(path, 0.0) > now:
+        return True
+    if os.path.isdir(path):
+        _directory_exists_cache[path] = now + ttl
+        return True
+    _directory_exists_cache.pop(path, None)
+    return False
+
+def ensure_directory(path):
+    """Create a directory (and parents) unless it is already known to exist"""
+    if not directory_exists(path):
+        os.makedirs(path, exist_ok=True)
+        _directory_exists_cache[path] = time.monotonic() + 5.0
+
 def get_session_id():
     """Generate or retrieve session ID"""
     if 'session_id' not in session:
         session['session_id'] = str(uuid.uuid4())
     return session['session_id']
 
+@lru_cache(maxsize=256)
+def page_template_name(page_name):
+    """Convert URL format to template format (e.g., chairs-promotion-letter -> chairs_promotion_letter.html)"""
+    return page_name.replace('-', '_') + '.html'
+
+def template_exists(jinja_env, template_name, refresh_interval=5.0):
+    """Check whether a template exists without a Jinja loader miss
+    
+    The template listing is cached, and only rescanned on a miss at most once
+    per refresh_interval seconds (every miss when Jinja auto-reload is on), so
+    templates added to the templates volume are still picked up while
+    scans for unknown URLs don't walk the filesystem.
+    
+    Args:
+        jinja_env: The application's Jinja environment
+        template_name: Template file name (e.g., chairs_promotion_letter.html)
+        refresh_interval: Minimum seconds between rescans on a miss
+    
+    Returns:
+        bool: True if the template is available
+    """
+    if template_name in _template_index['names']:
+        return True
+    
+    now = time.monotonic()
+    if jinja_env.auto_reload or now - _template_index['refreshed_at'] >= refresh_interval:
+        _template_index['names'] = frozenset(jinja_env.list_templates())
+        _template_index['refreshed_at'] = now
+        return template_name in _template_index['names']
+    
+    return False
+
+def get_page_configuration(page_name, template_folder='templates'):
+    """Resolve the template and server directories for a page
+    
+    The template is only re-read when its modification time changes, so
+    edits on the templates volume are picked up without a restart while
+    unchanged pages cost a single stat() per request.
+    
+    Args:
+        page_name: The name of the page from the URL (e.g., chairs-promotion-letter)
+        template_folder: Folder containing the page templates
+    
+    Returns:
+        MappingProxyType: Read-only mapping with 'template_name' and 'directories'
+        (a tuple that always starts with the page's own directory)
+    """
+    template_path = os.path.join(template_folder, page_template_name(page_name))
+    try:
+        template_mtime = os.stat(template_path).st_mtime_ns
+    except OSError:
+        template_mtime = None
+    return _load_page_configuration(page_name, template_folder, template_mtime)
+
+def warm_page_configurations(template_folder='templates'):
+    """Parse every page template's configuration once at startup
+    
+    Pages are warmed under their dashed URL form (chairs_promotion_letter.html ->
+    chairs-promotion-letter), which is how pages are linked.
+    
+    Returns:
+        int: Number of page configurations loaded
+    """
+    try:
+        template_names = [name for name in os.listdir(template_folder) if name.endswith('.html')]
+    except OSError as e:
+        logger.warning("Could not list templates for warmup: %s", e)
+        return 0
+    
+    for template_name in template_names:
+        get_page_configuration(template_name[:-5].replace('_', '-'), template_folder)
+    return len(template_names)
+
+@lru_cache(maxsize=256)
+def _load_page_configuration(page_name, template_folder, template_mtime):
+    """Parse a page's configuration; cached per template modification time"""
+    template_name = page_template_name(page_name)
+    
+    # Check if template specifies additional server directories
+    directories = [page_name]  # Always include the page's own directory
+    try:
+        template_path = os.path.join(template_folder, template_name)
+        if template_mtime is not None:
+            # Bytes go straight to orjson, so the template is never decoded
+            with open(template_path, 'rb') as f:
+                content = f.read()
+            # Look for server_dirs_config in the template (plain substring test
+            # first, so templates without one never reach the regex)
+            config_match = b'server_dirs_config' in content and SERVER_DIRS_CONFIG_RE.search(content)
+            if config_match:
+                try:
+                    config = orjson.loads(config_match.group(1))
+                    if isinstance(config, dict) and 'directories' in config:
+                        # Add specified directories (but keep page directory first)
+                        for dir_name in config['directories']:
+                            if dir_name not in directories:
+                                directories.append(dir_name)
+                        logger.info("Page %s loading from directories: %s", page_name, directories)
+                except orjson.JSONDecodeError:
+                    logger.warning("Invalid JSON in server_dirs_config for %s", page_name)
+    except Exception as e:
+        logger.warning("Error checking template for server_dirs_config: %s", e)
+    
+    return MappingProxyType({
+        'template_name': template_name,
+        'directories': tuple(directories)
+    })
+
 def get_server_files_info(page_name, directories=None):
     """Get information about available server files for display
     
@@ -34,50 +201,34 @@ def get_server_files_info(page_name, directories=None):
     for directory in directories:
         server_dir = f"/app/server_files/{directory}"
         
-        logger.info(f"Getting server files info for directory: {directory} from path: {server_dir}")
+        logger.debug("Getting server files info for directory: %s from path: %s", directory, server_dir)
         
-        if not os.path.exists(server_dir):
-            logger.info(f"Server files directory does not exist: {server_dir}")
+        if not directory_exists(server_dir):
+            logger.info("Server files directory does not exist: %s", server_dir)
             continue
         
         try:
             files_list = os.listdir(server_dir)
-            logger.info(f"Found {len(files_list)} files in {server_dir}: {files_list}")
+            logger.debug("Found %s files in %s: %s", len(files_list), server_dir, files_list)
             
             for filename in files_list:
                 try:
                     file_path = os.path.join(server_dir, filename)
-                    logger.info(f"Processing file: {file_path}")
+                    logger.debug("Processing file: %s", file_path)
                     
                     if not os.path.isfile(file_path):
-                        logger.info(f"Skipping {filename} - not a regular file")
+                        logger.debug("Skipping %s - not a regular file", filename)
                         continue
                     
                     # Get file info
                     file_stat = os.stat(file_path)
                     file_size = file_stat.st_size
                     
-                    # Format file size
-                    if file_size < 1024:
-                        size_str = f"{file_size} B"
-                    elif file_size < 1024 * 1024:
-                        size_str = f"{file_size / 1024:.1f} KB"
-                    else:
-                        size_str = f"{file_size / (1024 * 1024):.1f} MB"
-                    
-                    # Get file type
+                    # Format file size, file type and display name
+                    size_str = format_file_size(file_size)
                     file_ext = os.path.splitext(filename)[1].lower()
-                    if file_ext == '.docx':
-                        file_type = 'Word Document'
-                    elif file_ext == '.pdf':
-                        file_type = 'PDF Document'
-                    elif file_ext == '.txt':
-                        file_type = 'Text File'
-                    else:
-                        file_type = 'Unknown'
-                    
-                    # Create display name
-                    base_display_name = os.path.splitext(filename)[0].replace('_', ' ').replace('-', ' ').title()
+                    file_type = SERVER_FILE_TYPES.get(file_ext, 'Unknown')
+                    base_display_name = clean_filename(filename)
                     
                     # Add directory prefix if loading from multiple directories and not the page's own directory
                     if len(directories) > 1 and directory != page_name:
@@ -90,24 +241,24 @@ def get_server_files_info(page_name, directories=None):
                         'display_name': display_name,
                         'file_type': file_type,
                         'size': size_str,
-                        'supported': file_ext in ['.docx', '.pdf', '.txt'],
+                        'supported': file_ext in SUPPORTED_EXTENSIONS,
                         'source_directory': directory  # Track which directory this came from
                     }
                     
                     server_files_info.append(file_info)
-                    logger.info(f"Added file info: {file_info}")
+                    logger.debug("Added file info: %s", file_info)
                     
                 except Exception as file_error:
-                    logger.error(f"Error processing file {filename}: {file_error}")
+                    logger.error("Error processing file %s: %s", filename, file_error)
                     continue
             
         except Exception as e:
-            logger.error(f"Error listing files in directory {server_dir}: {e}")
+            logger.error("Error listing files in directory %s: %s", server_dir, e)
             continue
     
     # Sort by display name
     server_files_info.sort(key=lambda x: x['display_name'])
-    logger.info(f"Successfully processed {len(server_files_info)} files from {len(directories)} directories")
+    logger.info("Successfully processed %s files from %s directories", len(server_files_info), len(directories))
     
     return server_files_info
 
@@ -138,14 +289,42 @@ def get_file_type_display(file_extension):
 
 def is_supported_file(filename):
     """Check if file type is supported"""
-    supported_extensions = ['.docx', '.pdf', '.txt']
     file_ext = os.path.splitext(filename)[1].lower()
-    return file_ext in supported_extensions
+    return file_ext in SUPPORTED_EXTENSIONS
+
+def data_filename(filename):
+    """Make a safe .json data file name (appends .json, strips path characters)"""
+    if not filename.endswith('.json'):
+        filename += '.json'
+    return DATA_FILENAME_UNSAFE_RE.sub('', filename)
+
+def sanitize_directory_name(directory):
+    """Strip everything but letters, digits, '_' and '-' from a server_files directory name"""
+    return DIRECTORY_NAME_UNSAFE_RE.sub('', directory)
+
+@lru_cache(maxsize=256)
+def load_data_file(path, mtime_ns, size):
+    """Read and parse a saved JSON data file
+    
+    Cached per (path, mtime_ns, size), so a file rewritten by any worker is
+    re-read on its next load without explicit invalidation. The parsed object
+    is shared between callers: treat it as read-only.
+    """
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
 
 def sanitize_form_key(key):
     """Sanitize form key for display"""
     return key.replace('_', ' ').title()
 
+# Underscores become spaces in cleaned upload field names
+_UNDERSCORE_TO_SPACE = str.maketrans('_', ' ')
+
+@lru_cache(maxsize=256)
+def clean_field_name(field_name):
+    """Turn an upload field name like 'cv_file' into a context label like 'cv'"""
+    return field_name.replace('_file', '').translate(_UNDERSCORE_TO_SPACE)
+
 def truncate_text(text, max_length=500):
     """Truncate text with ellipsis if longer than max_length"""
     if len(text) <= max_length: